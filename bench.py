@@ -0,0 +1,409 @@
+"""Offline benchmark for getWeather against a local stand-in for Google Maps and OWM.
+
+Starts a threaded HTTP stub that serves canned Geocoding, Places Text Search,
+Places Details and OWM /weather payloads (with configurable latency and error
+injection, including a slow tail), points getWeather at it, and drives single,
+batch and concurrent workloads. Reports throughput, p50/p95/p99 latency, upstream
+call counts and hedges sent/won. --decode instead times decoding of realistic
+Geocoding and OWM payloads with each JSON backend (per-response time and memory);
+--memory measures bytes per cached weather / geocode entry, nested dicts vs the
+slotted WeatherObservation / ResolvedPlace.
+
+    python bench.py --workload all --requests 500 --unique 100 --latency-ms 30
+    python bench.py --decode
+    python bench.py --memory
+"""
+import argparse, json, random, sys, threading, time, timeit, tracemalloc, types, zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import urlparse, parse_qs
+
+if "keys" not in sys.modules:
+    try:
+        import keys  # noqa: F401
+    except ImportError:  # the stub never checks keys
+        sys.modules["keys"] = types.SimpleNamespace(WEATHERKEY="bench", MAPSKEY="bench")
+import getWeather as gw
+
+# ---------- Stub upstream ----------
+def _coords(text: str):
+    h = zlib.crc32(text.lower().encode("utf-8"))
+    return round(-60 + (h % 12000) / 100, 4), round(-180 + (h // 12000 % 36000) / 100, 4)
+
+def _place(text: str) -> dict:
+    lat, lng = _coords(text)
+    name = text.split(",")[0].strip().title()
+    return {
+        "place_id": f"pid-{zlib.crc32(text.encode('utf-8')):x}",
+        "name": name,
+        "geometry": {"location": {"lat": lat, "lng": lng}},
+        "formatted_address": f"{name}, CA, USA",
+        "types": ["locality", "political"],
+        "address_components": [
+            {"long_name": name, "short_name": name, "types": ["locality", "political"]},
+            {"long_name": "California", "short_name": "CA", "types": ["administrative_area_level_1", "political"]},
+            {"long_name": "United States", "short_name": "US", "types": ["country", "political"]},
+        ],
+    }
+
+def _weather(lat: float, lon: float) -> dict:
+    return {
+        "dt": int(time.time()), "name": "Stubville", "sys": {"country": "US"},
+        "coord": {"lat": lat, "lon": lon},
+        "main": {"temp": 21.5, "feels_like": 20.9, "humidity": 48},
+        "wind": {"speed": 3.6}, "weather": [{"description": "scattered clouds"}],
+        "clouds": {"all": 40},
+    }
+
+class StubServer:
+    """Local HTTP stand-in for the Google Maps and OWM endpoints getWeather calls."""
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_ms: float = 1000.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16  # headers + body in one segment
+
+            def do_GET(self):
+                u = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(u.query).items()}
+                with stub._lock:
+                    stub.calls[u.path] += 1
+                delay_ms = max(0.0, random.gauss(stub.latency_ms, stub.jitter_ms))
+                if random.random() < stub.slow_rate:
+                    delay_ms += stub.slow_ms
+                time.sleep(delay_ms / 1000)
+                if random.random() < stub.error_rate:
+                    if random.random() < 0.5:
+                        return self._send(429, {"error": "throttled"}, {"Retry-After": "0"})
+                    return self._send(503, {"error": "unavailable"})
+                self._send(200, stub.payload(u.path, q))
+
+            def _send(self, code, body, headers=None):
+                raw = json.dumps(body).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 256  # don't drop SYNs when many clients connect at once
+
+        self._srv = Server(("127.0.0.1", 0), Handler)
+        self._srv.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self._srv.server_address[1]}"
+
+    def payload(self, path: str, q: Dict[str, str]) -> dict:
+        if path.endswith("/geocode/json") or path.endswith("/textsearch/json"):
+            text = q.get("address") or q.get("query") or ""
+            if "zzz" in text:
+                return {"status": "ZERO_RESULTS", "results": []}
+            return {"status": "OK", "results": [_place(text)]}
+        if path.endswith("/details/json"):
+            return {"status": "OK", "result": _place(q.get("place_id", ""))}
+        if path.endswith("/weather"):
+            return _weather(float(q.get("lat", 0)), float(q.get("lon", 0)))
+        return {"status": "NOT_FOUND"}
+
+    def __enter__(self):
+        threading.Thread(target=self._srv.serve_forever, daemon=True).start()
+        gw.GEOCODE_URL = self.base + "/maps/api/geocode/json"
+        gw.PLACES_TEXT_URL = self.base + "/maps/api/place/textsearch/json"
+        gw.PLACES_DETAILS_URL = self.base + "/maps/api/place/details/json"
+        gw.OWM_URL = self.base + "/data/2.5/weather"
+        gw.reset_sessions()
+        return self
+
+    def __exit__(self, *exc):
+        self._srv.shutdown()
+        self._srv.server_close()
+
+# ---------- Workloads ----------
+def _reset_state(warm: bool) -> None:
+    if not warm:
+        gw.reset_sessions()
+        gw.GEO_CACHE = gw.GeocodeCache(None, gw.GEO_CACHE_MAX, gw.GEO_CACHE_TTL_S)
+        gw.WX_CACHE = gw.TTLCache(gw.WX_CACHE_MAX, gw.WX_STALE_IF_ERROR_S)
+        gw.NEG_CACHE = gw.NegativeCache(None, gw.NEG_CACHE_MAX, gw.NEG_CACHE_TTL_S, 1000)
+    gw.METRICS.reset()
+    gw.HEDGERS.update({u: gw.Hedger(u) for u in gw.HEDGERS})
+    gw.BREAKERS.update({u: gw.CircuitBreaker(u) for u in gw.BREAKERS})
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(round(p / 100 * (len(sorted_vals) - 1))))]
+
+def _timed_call(q: str):
+    t0 = time.perf_counter()
+    try:
+        gw.get_current_weather_via_gmaps(q)
+        ok = True
+    except Exception:
+        ok = False
+    return time.perf_counter() - t0, ok
+
+def run_workload(name: str, stub: StubServer, queries: List[str], concurrency: int) -> dict:
+    before = Counter(stub.calls)
+    t0 = time.perf_counter()
+    if name == "single":
+        outcomes = [_timed_call(q) for q in queries]
+    elif name == "concurrent":
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(_timed_call, queries))
+    elif name == "batch":
+        res = gw.get_current_weather_many(queries, concurrency=concurrency)
+        h = gw.METRICS.histogram("total")
+        outcomes = None
+    else:
+        raise ValueError(f"unknown workload {name!r}")
+    wall = time.perf_counter() - t0
+
+    if outcomes is not None:
+        lat = sorted(t for t, _ in outcomes)
+        errors = sum(1 for _, ok in outcomes if not ok)
+        p50, p95, p99 = (_pct(lat, p) for p in (50, 95, 99))
+    else:  # batch: per-item latency comes from the library's own "total" histogram
+        errors = res["failed"]
+        p50, p95, p99 = (h.percentile(p) for p in (50, 95, 99))
+    upstream = {path.rsplit("/", 2)[-2] + "/" + path.rsplit("/", 1)[-1]: n - before[path]
+                for path, n in stub.calls.items() if n - before[path]}
+    return {
+        "workload": name,
+        "requests": len(queries),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(queries) / wall, 1) if wall else 0.0,
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+        "upstream_calls": upstream,
+        "upstream_total": sum(upstream.values()),
+        "hedges": sum(h.sent for h in gw.HEDGERS.values()),
+        "hedge_wins": sum(h.wins for h in gw.HEDGERS.values()),
+    }
+
+def make_queries(n: int, unique: int, bad_ratio: float, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    pool = [f"Benchtown {i}" for i in range(unique)]
+    return [f"zzz {rnd.randrange(unique)}" if rnd.random() < bad_ratio else rnd.choice(pool) for _ in range(n)]
+
+# ---------- Decode microbenchmark ----------
+def _full_geocode_payload(n_results: int = 8) -> bytes:
+    """A Geocoding response shaped like Google's, with the fields getWeather never reads."""
+    results = []
+    for i in range(n_results):
+        p = _place(f"Benchtown {i}")
+        loc = p["geometry"]["location"]
+        box = {"northeast": {"lat": loc["lat"] + 0.1, "lng": loc["lng"] + 0.1},
+               "southwest": {"lat": loc["lat"] - 0.1, "lng": loc["lng"] - 0.1}}
+        p["geometry"].update({"bounds": box, "viewport": box, "location_type": "APPROXIMATE"})
+        p["address_components"][1:1] = [
+            {"long_name": f"{p['name']} County", "short_name": f"{p['name']} County",
+             "types": ["administrative_area_level_2", "political"]},
+            {"long_name": "Downtown", "short_name": "Downtown", "types": ["neighborhood", "political"]},
+            {"long_name": "90012", "short_name": "90012", "types": ["postal_code"]},
+        ]
+        p.update({"plus_code": {"compound_code": "2W4M+X8 Benchtown, CA, USA", "global_code": "85632W4M+X8"},
+                  "navigation_points": [{"location": {"latitude": loc["lat"], "longitude": loc["lng"]}}] * 3,
+                  "partial_match": False})
+        results.append(p)
+    return json.dumps({"results": results, "status": "OK"}).encode("utf-8")
+
+def _full_owm_payload() -> bytes:
+    w = _weather(34.05, -118.25)
+    w.update({"base": "stations", "visibility": 10000, "timezone": -25200, "id": 5368361, "cod": 200,
+              "rain": {"1h": 0.21}})
+    w["main"].update({"temp_min": 19.8, "temp_max": 23.1, "pressure": 1014, "sea_level": 1014, "grnd_level": 1001})
+    w["wind"].update({"deg": 250, "gust": 6.2})
+    w["sys"].update({"type": 2, "id": 2075946, "sunrise": 1700000000, "sunset": 1700040000})
+    w["weather"][0].update({"id": 802, "main": "Clouds", "icon": "03d"})
+    return json.dumps(w).encode("utf-8")
+
+def _canned_response(raw: bytes) -> "gw.requests.Response":
+    r = gw.requests.Response()
+    r.status_code, r._content = 200, raw
+    r.headers["Content-Type"] = "application/json; charset=UTF-8"
+    r.encoding = gw.requests.utils.get_encoding_from_headers(r.headers)  # as the HTTP adapter sets it
+    return r
+
+def _legacy_gmaps_get() -> dict:
+    """_gmaps_get as it was: the whole body decoded to text for the status check, then r.json()."""
+    r = gw._http_get("geocode", gw.GEOCODE_URL, {})
+    text = r.text
+    if r.status_code >= 400:
+        raise RuntimeError(text[:200])
+    return gw._gmaps_status(r.json())
+
+def decode_bench(repeat: int = 2000) -> List[dict]:
+    """Per-response decode time and allocations, r.json() (text decode + full parse) vs each backend.
+
+    The gmaps_get rows time the whole _gmaps_get call (status checks included) on a canned
+    requests.Response, against the r.text + r.json() path it replaced.
+    """
+    geocode = _full_geocode_payload()
+    payloads = {"geocode": (geocode, gw.GMAPS_FIELDS), "owm": (_full_owm_payload(), gw.OWM_FIELDS),
+                "gmaps_get": (geocode, None)}
+    backends = ["r.json", "json"] + [b for b, mod in (("orjson", gw.orjson), ("simdjson", gw.simdjson)) if mod]
+    saved, saved_get, rows = gw.JSON_BACKEND, gw._http_get, []
+    resp = _canned_response(geocode)
+    gw._http_get = lambda *a, **k: resp
+    try:
+        for payload, (raw, fields) in payloads.items():
+            for backend in backends:
+                if backend != "r.json":
+                    gw.JSON_BACKEND = backend
+                if payload == "gmaps_get":
+                    fn = _legacy_gmaps_get if backend == "r.json" else (lambda: gw._gmaps_get(gw.GEOCODE_URL, {}))
+                elif backend == "r.json":
+                    fn = lambda: json.loads(raw.decode("utf-8"))
+                else:
+                    fn = lambda: gw._decode(raw, fields)
+                fn()
+                per_op = timeit.timeit(fn, number=repeat) / repeat
+                tracemalloc.start()
+                kept = fn()
+                retained, peak = tracemalloc.get_traced_memory()
+                blocks = sum(st.count for st in tracemalloc.take_snapshot().statistics("filename"))
+                tracemalloc.stop()
+                del kept
+                rows.append({"payload": payload, "backend": backend, "bytes": len(raw),
+                             "us_per_op": round(per_op * 1e6, 2), "peak_kib": round(peak / 1024, 1),
+                             "kept_kib": round(retained / 1024, 1), "kept_blocks": blocks})
+    finally:
+        gw.JSON_BACKEND, gw._http_get = saved, saved_get
+    return rows
+
+# ---------- Cache memory per entry ----------
+_DESCRIPTIONS = ["clear sky", "few clouds", "scattered clouds", "broken clouds", "overcast clouds", "light rain"]
+
+def _legacy_observation(j: dict) -> dict:
+    """The nested dict _owm_normalize built (and WX_CACHE held) before WeatherObservation."""
+    return {
+        "source": "current",
+        "time_utc": gw.datetime.fromtimestamp(j["dt"], tz=gw.timezone.utc).isoformat(),
+        "location": {"name": j.get("name"), "country": (j.get("sys") or {}).get("country"), "coord": j.get("coord")},
+        "temp": j["main"]["temp"], "feels_like": j["main"]["feels_like"], "humidity": j["main"]["humidity"],
+        "wind_mps": (j.get("wind") or {}).get("speed"),
+        "weather": j["weather"][0]["description"] if j.get("weather") else None,
+        "clouds_pct": (j.get("clouds") or {}).get("all"),
+        "rain_mm_1h": (j.get("rain") or {}).get("1h"), "snow_mm_1h": (j.get("snow") or {}).get("1h"),
+    }
+
+def _per_entry(payloads: List[bytes], build) -> float:
+    """Traced bytes per entry of a TTLCache holding build(decoded payload) for each payload."""
+    cache = gw.TTLCache(len(payloads), 3600)
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    for i, raw in enumerate(payloads):
+        cache.put(i, (time.time(), build(json.loads(raw))))
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (used - base) / len(payloads)
+
+def memory_bench(n: int = 20_000, seed: int = 1) -> List[dict]:
+    rnd = random.Random(seed)
+    wx, geo = [], []
+    for i in range(n):
+        city = f"Benchtown {rnd.randrange(500)}"
+        lat, lon = _coords(f"{city} {i}")
+        w = _weather(lat, lon)
+        w.update({"dt": 1700000000 + i, "name": city})
+        w["main"].update({"temp": round(rnd.uniform(-10, 35), 2), "feels_like": round(rnd.uniform(-15, 35), 2),
+                          "humidity": rnd.randrange(100)})
+        w["wind"]["speed"] = round(rnd.uniform(0, 15), 2)
+        w["weather"][0]["description"] = rnd.choice(_DESCRIPTIONS)
+        wx.append(json.dumps(w).encode("utf-8"))
+        geo.append(json.dumps({"results": [_place(f"{city} {i}")]}).encode("utf-8"))
+    rows = [
+        ("weather", "dict", _per_entry(wx, _legacy_observation)),
+        ("weather", "slotted", _per_entry(wx, gw._owm_normalize)),
+        ("geocode", "dict", _per_entry(geo, lambda j: gw._pick_geocode(j["results"]))),
+        ("geocode", "slotted", _per_entry(geo, lambda j: gw.ResolvedPlace.from_dict(gw._pick_geocode(j["results"])))),
+    ]
+    return [{"cache": c, "entry": form, "entries": n, "bytes_per_entry": round(b)} for c, form, b in rows]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workload", choices=["single", "batch", "concurrent", "all"], default="all")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--unique", type=int, default=50, help="distinct locations in the query mix")
+    ap.add_argument("--bad-ratio", type=float, default=0.0, help="share of unresolvable queries")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--jitter-ms", type=float, default=5.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses that are 429/503")
+    ap.add_argument("--slow-rate", type=float, default=0.0, help="share of stub responses delayed by --slow-ms")
+    ap.add_argument("--slow-ms", type=float, default=1000.0)
+    ap.add_argument("--hedge", action="store_true", help="hedge slow geocode and OWM calls")
+    ap.add_argument("--places", action="store_true", help="resolve via Places Text Search + Details")
+    ap.add_argument("--warm", action="store_true", help="keep caches between workloads")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--decode", action="store_true", help="run the JSON decode microbenchmark instead")
+    ap.add_argument("--memory", action="store_true", help="report memory per cached entry instead")
+    args = ap.parse_args(argv)
+
+    if args.memory:
+        rows = memory_bench()
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print(f"{'cache':<9}{'entry':<9}{'entries':>9}{'bytes/entry':>13}")
+            for r in rows:
+                print(f"{r['cache']:<9}{r['entry']:<9}{r['entries']:>9}{r['bytes_per_entry']:>13}")
+        return 0
+
+    if args.decode:
+        rows = decode_bench()
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print(f"{'payload':<11}{'backend':<10}{'bytes':>7}{'us/op':>9}{'peak KiB':>10}{'kept KiB':>10}{'blocks':>8}")
+            for r in rows:
+                print(f"{r['payload']:<11}{r['backend']:<10}{r['bytes']:>7}{r['us_per_op']:>9}{r['peak_kib']:>10}"
+                      f"{r['kept_kib']:>10}{r['kept_blocks']:>8}")
+        return 0
+
+    gw.USE_PLACES = args.places
+    gw.HEDGE_UPSTREAMS = ("geocode", "owm") if args.hedge else ()
+    gw.LIMITERS.clear()  # measure the pipeline, not our own QPS cap
+    gw.BACKOFF_BASE_S = 0.01
+    queries = make_queries(args.requests, args.unique, args.bad_ratio, args.seed)
+    names = ["single", "batch", "concurrent"] if args.workload == "all" else [args.workload]
+    rows = []
+    with StubServer(args.latency_ms, args.jitter_ms, args.error_rate, args.slow_rate, args.slow_ms) as stub:
+        for name in names:
+            _reset_state(args.warm)
+            rows.append(run_workload(name, stub, queries, args.concurrency))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'workload':<11}{'reqs':>6}{'errs':>6}{'wall s':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'hedges':>9}  upstream")
+        for r in rows:
+            calls = ", ".join(f"{k}={v}" for k, v in sorted(r["upstream_calls"].items()))
+            hedges = f"{r['hedge_wins']}/{r['hedges']}"
+            print(f"{r['workload']:<11}{r['requests']:>6}{r['errors']:>6}{r['wall_s']:>9}{r['throughput_rps']:>9}"
+                  f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{hedges:>9}  {r['upstream_total']} ({calls})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
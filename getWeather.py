@@ -1,15 +1,84 @@
-import sys, json, requests
-from typing import Optional, Tuple, Dict
+import sys, os, re, json, math, time, hashlib, unicodedata, mmap, random, struct, sqlite3, threading, functools, asyncio, weakref, requests
+from array import array
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Tuple, Dict, Any, Iterable, List
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+try:
+    import httpx  # optional: only needed for the *_async functions
+except ImportError:
+    httpx = None
+try:
+    import orjson  # optional: fastest full decode of upstream payloads
+except ImportError:
+    orjson = None
+try:
+    import simdjson  # optional: lazy parsing, only the fields we read get materialized
+except ImportError:
+    simdjson = None
 from keys import WEATHERKEY, MAPSKEY  # keys.py must define WEATHERKEY and MAPSKEY
 
 # ====== CONFIG ======
 GMAPS_KEY = MAPSKEY
 OWM_KEY   = WEATHERKEY
 UNITS     = "imperial"   # "metric" (°C) or "imperial" (°F)
-TIMEOUT_S = 12
+TIMEOUT_S = 12           # read timeout per upstream call
+CONNECT_TIMEOUT_S = 3.05 # TCP + TLS connect, per upstream call
+REQUEST_DEADLINE_S = 20.0  # total budget for one lookup across every hop (None -> per-call timeouts only)
+MIN_HOP_BUDGET_S = 0.25  # don't start a hop (or a retry) with less budget than this left
 USE_PLACES = False       # True -> Places Text Search; False -> Geocoding API
+PLACES_DERIVE_FROM_SEARCH = True  # take city/country from Text Search when it suffices (skips Details)
 COUNTRY_PREF = ["US", "CA", "GB", "AU", "FR", "DE"]
+GEOCODE_URL        = "https://maps.googleapis.com/maps/api/geocode/json"
+PLACES_TEXT_URL    = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+PLACES_DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+OWM_URL            = "https://api.openweathermap.org/data/2.5/weather"
+JSON_BACKEND = "auto"    # upstream payload decoding: "simdjson", "orjson", "json" or "auto" (first installed)
+POOL_MAXSIZE = {"geocode": 32, "places": 16, "owm": 32}  # keep-alive connections per upstream
+PER_THREAD_SESSIONS = False        # True -> one Session per thread instead of the shared one (see SESSION)
+PREWARM_CONNECTIONS = 2            # per upstream, opened by prewarm_connections() (serve() calls it)
+GEO_CACHE_TTL_S = 30 * 24 * 3600   # places don't move; re-resolve monthly
+GEO_CACHE_MAX   = 10_000           # in-memory LRU entries
+GEO_CACHE_DB    = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocache.sqlite3")  # None -> memory only
+WX_GRID_DEG     = 0.05             # snap lat/lon to this grid for weather lookups (0 -> raw coords)
+NEG_CACHE_TTL_S = 6 * 3600         # how long a ZERO_RESULTS query fails fast
+NEG_CACHE_MAX   = 10_000           # in-memory LRU; older negatives live in SQLite behind a Bloom filter
+NEG_BLOOM_CAPACITY = 1_000_000     # ~1.2 MB of bits at a 1% false-positive rate
+WX_CACHE_TTL_S  = 600              # OWM refreshes current conditions roughly every 10 min
+WX_SWR_S        = 1800             # until this age: serve cached weather at once, refresh in background
+WX_STALE_IF_ERROR_S = 6 * 3600     # until this age: serve cached weather (flagged stale) if OWM is failing
+WX_CACHE_MAX    = 50_000
+WX_REFRESH_WORKERS = 4
+ASYNC_MAX_CONNECTIONS = 200        # per event loop, for the *_async functions
+BATCH_CONCURRENCY = 8              # default worker threads for get_current_weather_many
+SPECULATIVE_US_FALLBACK = False    # True -> issue the ", US" retry concurrently with the primary lookup
+SPECULATIVE_WORKERS = 8
+SPECULATIVE_DELAY_S = 0.15         # head start for the primary; the ", US" retry only goes out if it's still pending
+RATE_LIMIT_QPS = {"geocode": 50.0, "places": 10.0, "owm": 10.0}  # per upstream, match your plan; None -> unlimited
+MAX_RETRIES    = 3                 # extra attempts on timeouts, network errors, 429 and 5xx
+BACKOFF_BASE_S = 0.5               # full-jitter exponential backoff: uniform(0, base * 2**attempt)
+BACKOFF_MAX_S  = 8.0               # also the longest Retry-After we'll wait out
+HEDGE_UPSTREAMS = ()               # e.g. ("geocode", "owm"): duplicate a slow call, first answer wins
+HEDGE_PERCENTILE = 95.0            # hedge once an attempt outlives this percentile of its upstream's latency
+HEDGE_MIN_SAMPLES = 50             # latency samples needed before hedging starts
+HEDGE_MIN_DELAY_S = 0.05           # never hedge sooner than this
+HEDGE_MAX_RATIO = 0.05             # hedges per request, so quota overhead stays within ~5%
+HEDGE_BURST = 10                   # unspent hedge budget carried over
+HEDGE_REFRESH_S = 1.0              # recompute the percentile threshold this often
+HEDGE_WORKERS = 64                 # hedged attempts in flight; beyond this, calls run unhedged on the caller's thread
+BREAKER_WINDOW_S = 30.0            # circuit breakers judge each upstream on its calls in this window
+BREAKER_MIN_CALLS = 20             # ...once it has at least this many
+BREAKER_ERROR_RATE = 0.5           # open at this share of transport errors / 5xx
+BREAKER_OPEN_S = 15.0              # fail fast this long, then let a trial request through
+BREAKER_HALF_OPEN_PROBES = 1       # trial requests in flight at once while half-open
+METRICS_PORT   = 9108              # serve_metrics() default (Prometheus text at /metrics)
+SERVE_HOST     = "127.0.0.1"       # --serve: GET /weather?q=...&units=...&format=json|text&deadline=s
+SERVE_PORT     = 8080
 
 ALIASES: Dict[str, Tuple[str, Optional[str]]] = {
     "la": ("Los Angeles", "US"),
@@ -20,35 +89,1084 @@ ALIASES: Dict[str, Tuple[str, Optional[str]]] = {
     "dc": ("Washington", "US"),
     "d.c.": ("Washington", "US"),
 }
+ALIASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aliases.json")  # built by --build-aliases
+ALIAS_MAX_EDIT = 2                 # fuzzy alias matching: 0 edits for <=4 chars, 1 up to 7, then this
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.idx")  # optional; --build-gazetteer
+GAZETTEER_DOMINANCE = 10         # a city this many times larger overrides COUNTRY_PREF ("paris" -> FR, not TX)
+POSTAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "postal.idx")  # optional; --build-postal
 
 if not GMAPS_KEY:
     sys.exit("ERROR: MAPSKEY (Google) is empty in keys.py")
 if not OWM_KEY:
     sys.exit("ERROR: WEATHERKEY (OpenWeatherMap) is empty in keys.py")
 
-SESSION = requests.Session()
+# ---------- Metrics ----------
+class Histogram:
+    """Log-bucketed latency histogram (HDR-style: ~2% relative error, bounded memory)."""
+    _GROWTH = 1.02
+    _LOG_GROWTH = math.log(_GROWTH)
 
-# ---------- Google helpers ----------
-def _gmaps_get(url: str, params: dict) -> dict:
-    """Call Google API and normalize errors/status."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        idx = int(math.log(max(seconds * 1e6, 1.0)) / self._LOG_GROWTH)
+        with self._lock:
+            self._buckets[idx] = self._buckets.get(idx, 0) + 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound (seconds) of the bucket holding the p-th percentile."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = p / 100.0 * self.count
+            seen = 0
+            for idx in sorted(self._buckets):
+                seen += self._buckets[idx]
+                if seen >= rank:
+                    return min(self._GROWTH ** (idx + 1) / 1e6, self.max)
+            return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(1000 * self.percentile(50), 3),
+            "p90_ms": round(1000 * self.percentile(90), 3),
+            "p99_ms": round(1000 * self.percentile(99), 3),
+            "max_ms": round(1000 * self.max, 3),
+        }
+
+class Metrics:
+    """Named latency histograms and counters."""
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def histogram(self, name: str) -> Histogram:
+        h = self.histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self.histograms.setdefault(name, Histogram())
+        return h
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.histogram(name).record(seconds)
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def timed(self, name: str):
+        """Decorator form of timer() for plain and async functions."""
+        def wrap(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def ainner(*a, **kw):
+                    with self.timer(name):
+                        return await fn(*a, **kw)
+                return ainner
+
+            @functools.wraps(fn)
+            def inner(*a, **kw):
+                with self.timer(name):
+                    return fn(*a, **kw)
+            return inner
+        return wrap
+
+METRICS = Metrics()
+
+# ---------- Result types ----------
+# Cache entries are slotted objects instead of nested dicts (a fraction of the memory each);
+# to_dict() builds the public dict shape only when a result goes out.
+def _intern(s: Optional[str]) -> Optional[str]:
+    return sys.intern(s) if isinstance(s, str) else s
+
+@dataclass
+class ResolvedPlace:
+    """A geocoded place as GEO_CACHE holds it; to_dict() is the geo dict the resolvers return."""
+    __slots__ = ("lat", "lon", "city", "country", "formatted", "types")
+    lat: float
+    lon: float
+    city: Optional[str]
+    country: Optional[str]
+    formatted: Optional[str]
+    types: Tuple[str, ...]
+
+    @classmethod
+    def from_dict(cls, geo: dict) -> "ResolvedPlace":
+        return cls(geo["lat"], geo["lon"], geo.get("city"), _intern(geo.get("country")), geo.get("formatted"),
+                   tuple(_intern(t) for t in geo.get("types") or ()))
+
+    def to_dict(self) -> dict:
+        return {"lat": self.lat, "lon": self.lon, "city": self.city, "country": self.country,
+                "formatted": self.formatted, "types": list(self.types)}
+
+@dataclass
+class WeatherObservation:
+    """Current conditions in metric units as WX_CACHE holds them; to_dict() is the public result shape."""
+    __slots__ = ("dt", "name", "country", "lat", "lon", "temp", "feels_like", "humidity",
+                 "wind_mps", "weather", "clouds_pct", "rain_mm_1h", "snow_mm_1h")
+    dt: int
+    name: Optional[str]
+    country: Optional[str]
+    lat: Optional[float]
+    lon: Optional[float]
+    temp: float
+    feels_like: float
+    humidity: float
+    wind_mps: Optional[float]
+    weather: Optional[str]
+    clouds_pct: Optional[float]
+    rain_mm_1h: Optional[float]
+    snow_mm_1h: Optional[float]
+
+    def to_dict(self) -> dict:
+        return {
+            "source": "current",
+            "time_utc": datetime.fromtimestamp(self.dt, tz=timezone.utc).isoformat(),
+            "location": {
+                "name": self.name,
+                "country": self.country,
+                "coord": {"lon": self.lon, "lat": self.lat} if self.lat is not None else None,
+            },
+            "temp": self.temp,
+            "feels_like": self.feels_like,
+            "humidity": self.humidity,
+            "wind_mps": self.wind_mps,
+            "weather": self.weather,
+            "clouds_pct": self.clouds_pct,
+            "rain_mm_1h": self.rain_mm_1h,
+            "snow_mm_1h": self.snow_mm_1h,
+        }
+
+# ---------- Caching ----------
+class TTLCache:
+    """Thread-safe in-memory LRU whose entries expire after ttl_s seconds."""
+    def __init__(self, maxsize: int, ttl_s: float):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Any, value: Any, ttl_s: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + (self.ttl_s if ttl_s is None else ttl_s), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class GeocodeCache:
+    """Read-through geocode cache: in-memory LRU tier in front of an SQLite (WAL) tier."""
+    def __init__(self, path: Optional[str], maxsize: int, ttl_s: float):
+        self.ttl_s = ttl_s
+        self.mem = TTLCache(maxsize, ttl_s)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode (k TEXT PRIMARY KEY, v TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM geocode WHERE expires <= ?", (time.time(),))
+            except sqlite3.Error:
+                self._db = None  # unwritable location -> memory only
+
+    def get(self, key: str, revive=None) -> Any:
+        """Cached value for key; revive turns a dict read back from SQLite into the in-memory form."""
+        v = self.mem.get(key)
+        if v is None and self._db is not None:
+            with self._lock:
+                row = self._db.execute("SELECT v, expires FROM geocode WHERE k = ?", (key,)).fetchone()
+            if row and row[1] > time.time():
+                v = json.loads(row[0])
+                if revive is not None:
+                    v = revive(v)
+                self.mem.put(key, v, ttl_s=row[1] - time.time())
+                self.disk_hits += 1
+        if v is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return v
+
+    def __contains__(self, key: str) -> bool:
+        """Whether either tier holds a live entry for key (not counted as a hit or miss)."""
+        if self.mem.get(key) is not None:
+            return True
+        if self._db is None:
+            return False
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM geocode WHERE k = ? AND expires > ?", (key, time.time())).fetchone()
+        return row is not None
+
+    def put(self, key: str, value: Any) -> None:
+        self.mem.put(key, value)
+        if self._db is not None:
+            raw = json.dumps(value.to_dict() if isinstance(value, ResolvedPlace) else value)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocode (k, v, expires) VALUES (?, ?, ?)",
+                    (key, raw, time.time() + self.ttl_s),
+                )
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "memory_entries": len(self.mem),
+        }
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key onto one in-flight upstream call."""
+    class _Call:
+        __slots__ = ("done", "result", "error")
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, "SingleFlight._Call"] = {}
+        self._tasks: Dict[Any, "asyncio.Future"] = {}
+
+    def do(self, key: Any, fn, timeout: Optional[float] = None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Request deadline exceeded waiting on a shared lookup.")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key: Any, coro_fn, timeout: Optional[float] = None):
+        k = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(k)
+        if task is None:
+            task = self._tasks[k] = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(lambda _t: self._tasks.pop(k, None))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            if task.done():  # the lookup itself timed out
+                raise
+            raise TimeoutError("Request deadline exceeded waiting on a shared lookup.") from None
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "shared": self.shared}
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)."""
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.m = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self._bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key: str):
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self._bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+class NegativeCache:
+    """Queries known to resolve to nothing: LRU in memory, long tail in SQLite.
+
+    A Bloom filter of everything on disk keeps the common case (a query that has
+    never failed) from touching SQLite; a Bloom hit is always confirmed on disk,
+    so false positives never reject a good query.
+    """
+    def __init__(self, path: Optional[str], maxsize: int, ttl_s: float, bloom_capacity: int):
+        self.ttl_s = ttl_s
+        self.mem = TTLCache(maxsize, ttl_s)
+        self.bloom = BloomFilter(bloom_capacity)
+        self.hits = 0
+        self.disk_checks = 0
+        self._db = None
+        self._lock = threading.Lock()
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS negative (k TEXT PRIMARY KEY, expires REAL NOT NULL)")
+                self._db.execute("DELETE FROM negative WHERE expires <= ?", (time.time(),))
+                for (k,) in self._db.execute("SELECT k FROM negative"):
+                    self.bloom.add(k)
+            except sqlite3.Error:
+                self._db = None
+
+    def add(self, key: str) -> None:
+        self.mem.put(key, True)
+        self.bloom.add(key)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute("INSERT OR REPLACE INTO negative (k, expires) VALUES (?, ?)",
+                                 (key, time.time() + self.ttl_s))
+
+    def __contains__(self, key: str) -> bool:
+        found = self.mem.get(key) is not None
+        if not found and self._db is not None and key in self.bloom:
+            self.disk_checks += 1
+            with self._lock:
+                row = self._db.execute("SELECT expires FROM negative WHERE k = ?", (key,)).fetchone()
+            if row and row[0] > time.time():
+                self.mem.put(key, True, ttl_s=row[0] - time.time())
+                found = True
+        if found:
+            self.hits += 1
+        return found
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "disk_checks": self.disk_checks, "memory_entries": len(self.mem)}
+
+GEO_CACHE = GeocodeCache(GEO_CACHE_DB, GEO_CACHE_MAX, GEO_CACHE_TTL_S)
+GEO_FLIGHT = SingleFlight()
+NEG_CACHE = NegativeCache(GEO_CACHE_DB, NEG_CACHE_MAX, NEG_CACHE_TTL_S, NEG_BLOOM_CAPACITY)
+
+# ---------- Query normalization ----------
+# normalize_query() is the single key for aliases, the gazetteer, every cache and batch
+# dedupe. It only merges spellings of the same query; suffixes that could change the
+# answer ("paris, tx" vs "paris") are canonicalized, not dropped.
+US_STATES = {
+    "alabama": "al", "alaska": "ak", "arizona": "az", "arkansas": "ar", "california": "ca",
+    "colorado": "co", "connecticut": "ct", "delaware": "de", "district of columbia": "dc",
+    "florida": "fl", "georgia": "ga", "hawaii": "hi", "idaho": "id", "illinois": "il",
+    "indiana": "in", "iowa": "ia", "kansas": "ks", "kentucky": "ky", "louisiana": "la",
+    "maine": "me", "maryland": "md", "massachusetts": "ma", "michigan": "mi", "minnesota": "mn",
+    "mississippi": "ms", "missouri": "mo", "montana": "mt", "nebraska": "ne", "nevada": "nv",
+    "new hampshire": "nh", "new jersey": "nj", "new mexico": "nm", "new york": "ny",
+    "north carolina": "nc", "north dakota": "nd", "ohio": "oh", "oklahoma": "ok", "oregon": "or",
+    "pennsylvania": "pa", "rhode island": "ri", "south carolina": "sc", "south dakota": "sd",
+    "tennessee": "tn", "texas": "tx", "utah": "ut", "vermont": "vt", "virginia": "va",
+    "washington": "wa", "west virginia": "wv", "wisconsin": "wi", "wyoming": "wy",
+}
+_US_STATE_CODES = frozenset(US_STATES.values())
+COUNTRY_SYNONYMS = {
+    "usa": "us", "united states": "us", "united states of america": "us", "america": "us",
+    "uk": "gb", "united kingdom": "gb", "great britain": "gb",
+    "france": "fr", "germany": "de", "deutschland": "de", "australia": "au",
+    "italy": "it", "italia": "it", "austria": "at", "czechia": "cz", "czech republic": "cz",
+    "portugal": "pt", "russia": "ru", "poland": "pl", "denmark": "dk", "belgium": "be",
+    "netherlands": "nl", "china": "cn", "mexico": "mx",
+}
+# local name -> (English name, country); only applied with no suffix or that country's own
+EXONYMS = {
+    "nueva york": ("new york", "us"), "londres": ("london", "gb"), "londra": ("london", "gb"),
+    "munchen": ("munich", "de"), "koln": ("cologne", "de"), "roma": ("rome", "it"),
+    "wien": ("vienna", "at"), "praha": ("prague", "cz"), "lisboa": ("lisbon", "pt"),
+    "firenze": ("florence", "it"), "venezia": ("venice", "it"), "napoli": ("naples", "it"),
+    "moskva": ("moscow", "ru"), "warszawa": ("warsaw", "pl"), "kobenhavn": ("copenhagen", "dk"),
+    "bruxelles": ("brussels", "be"), "den haag": ("the hague", "nl"), "beijing shi": ("beijing", "cn"),
+    "ciudad de mexico": ("mexico city", "mx"),
+}
+# Apostrophes and abbreviation dots vanish ("st. john's" -> "st johns"); decimal points and
+# leading signs stay, so "34.05,-118.24" and "-34.05,118.24" keep distinct keys.
+_DROP_PUNCT = re.compile(r"['’`]|\.(?!\d)")
+_SPLIT_PUNCT = re.compile(r"(?![-+.]\d)[^\w\s,]|_")
+# city -> suffix parts that add nothing for it ("new york" -> {"ny", "us"}); filled from the alias registry
+_REDUNDANT_SUFFIXES: Dict[str, set] = {}
+
+def _canon_parts(text: str) -> List[str]:
+    t = unicodedata.normalize("NFKC", text).casefold()
+    t = "".join(c for c in unicodedata.normalize("NFKD", t) if not unicodedata.combining(c))
+    t = _SPLIT_PUNCT.sub(" ", _DROP_PUNCT.sub("", t))
+    parts = [" ".join(p.split()) for p in t.split(",")]
+    parts = [p for p in parts if p]
+    if not parts:
+        return []
+    suffixes = [COUNTRY_SYNONYMS.get(p) or US_STATES.get(p) or p for p in parts[1:]]
+    if parts[0] in EXONYMS:
+        name, cc = EXONYMS[parts[0]]
+        # "napoli, ny" and "roma, tx" are places of their own, not Naples or Rome
+        if all(p == cc or (cc == "us" and p in _US_STATE_CODES) for p in suffixes):
+            parts[0] = name
+    return parts[:1] + suffixes
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a free-text location: NFKC, casefold, accents and punctuation
+    folded, exonyms mapped, state/country suffixes canonicalized ("new york, ny" ->
+    "new york", "Zürich" -> "zurich", "Nueva York" -> "new york")."""
+    parts = _canon_parts(text)
+    if len(parts) > 1 and all(p in _REDUNDANT_SUFFIXES.get(parts[0], ()) for p in parts[1:]):
+        parts = parts[:1]
+    return ", ".join(parts)
+
+def normalization_report(lines: Iterable[str], top: int = 20) -> dict:
+    """How many distinct raw inputs in a query log collapse onto each canonical key."""
+    raw = Counter(l.strip() for l in lines if l.strip())
+    groups: Dict[str, set] = {}
+    for q in raw:
+        groups.setdefault(normalize_query(q), set()).add(q)
+    ranked = sorted(groups.items(), key=lambda kv: (-len(kv[1]), kv[0]))
+    return {
+        "queries": sum(raw.values()),
+        "distinct_raw": len(raw),
+        "distinct_canonical": len(groups),
+        "collapse_ratio": round(len(raw) / len(groups), 3) if groups else 0.0,
+        "top": [{"key": k, "variants": len(v), "examples": sorted(v)[:5]} for k, v in ranked[:top] if len(v) > 1],
+    }
+
+def _cache_key(text: str) -> str:
+    return normalize_query(text)
+
+def _geo_cached(mode: str):
+    """Serve a resolver from GEO_CACHE, keyed on the normalized query and the lookup mode."""
+    def wrap(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def ainner(query: str, deadline: Optional["Deadline"] = None) -> Optional[dict]:
+                key = f"{mode}|{_cache_key(query)}"
+                hit = GEO_CACHE.get(key, revive=ResolvedPlace.from_dict)
+                if hit is not None:
+                    return hit.to_dict()
+                async def fetch():
+                    geo = await fn(query, deadline)
+                    if geo is None:
+                        return None
+                    place = ResolvedPlace.from_dict(geo)
+                    GEO_CACHE.put(key, place)
+                    return place
+                place = await GEO_FLIGHT.ado(key, fetch, timeout=_budget(deadline))
+                return place.to_dict() if place is not None else None
+            return ainner
+
+        @functools.wraps(fn)
+        def inner(query: str, deadline: Optional["Deadline"] = None) -> Optional[dict]:
+            key = f"{mode}|{_cache_key(query)}"
+            hit = GEO_CACHE.get(key, revive=ResolvedPlace.from_dict)
+            if hit is not None:
+                return hit.to_dict()
+            def fetch():
+                geo = fn(query, deadline)
+                if geo is None:
+                    return None
+                place = ResolvedPlace.from_dict(geo)
+                GEO_CACHE.put(key, place)
+                return place
+            place = GEO_FLIGHT.do(key, fetch, timeout=_budget(deadline))
+            return place.to_dict() if place is not None else None
+        return inner
+    return wrap
+
+# ---------- HTTP ----------
+UPSTREAM_LABELS = {"geocode": "Google Maps", "places": "Google Maps", "owm": "OpenWeatherMap"}
+
+class TokenBucket:
+    """Client-side rate limiter: rate tokens/s, bursting up to burst."""
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_take(self) -> bool:
+        """Take a token only if one is available right now."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+class Deadline:
+    """Total time budget for one lookup, shared by every upstream hop it makes."""
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def timeouts(self, label: str) -> Tuple[float, float]:
+        """(connect, read) timeouts for the next hop, capped by what's left of the budget."""
+        left = self.remaining()
+        if left < MIN_HOP_BUDGET_S:
+            METRICS.incr("deadline_exceeded")
+            raise TimeoutError(f"Request deadline exceeded before calling {label}.")
+        return min(CONNECT_TIMEOUT_S, left), min(TIMEOUT_S, left)
+
+def _budget(deadline: Optional[Deadline]) -> Optional[float]:
+    return deadline.remaining() if deadline is not None else None
+
+def _hop_timeouts(deadline: Optional[Deadline], label: str) -> Tuple[float, float]:
+    return deadline.timeouts(label) if deadline is not None else (CONNECT_TIMEOUT_S, TIMEOUT_S)
+
+def _limiter_wait(limiter: Optional[TokenBucket], deadline: Optional[Deadline], label: str) -> float:
+    """Seconds to wait for a rate-limit token; TimeoutError if that would eat the rest of the budget."""
+    wait = limiter.reserve() if limiter else 0.0
+    if wait and deadline is not None and wait + MIN_HOP_BUDGET_S > deadline.remaining():
+        METRICS.incr("deadline_exceeded")
+        raise TimeoutError(f"Request deadline exceeded waiting for the {label} rate limit.")
+    return wait
+
+def _retry_within(delay: Optional[float], deadline: Optional[Deadline]) -> Optional[float]:
+    """delay, or None (give up) when sleeping it would leave too little budget for another attempt."""
+    if delay is not None and deadline is not None and delay + MIN_HOP_BUDGET_S > deadline.remaining():
+        METRICS.incr("deadline_exceeded")
+        return None
+    return delay
+
+def _upstream_prefixes() -> Dict[str, str]:
+    return {
+        "geocode": GEOCODE_URL.rsplit("/", 1)[0] + "/",
+        "places": os.path.commonprefix([PLACES_TEXT_URL, PLACES_DETAILS_URL]),
+        "owm": OWM_URL.rsplit("/", 1)[0] + "/",
+    }
+
+_SESSIONS: "weakref.WeakSet[requests.Session]" = weakref.WeakSet()
+_TLS = threading.local()
+
+def _new_session() -> requests.Session:
+    """Session with one connection pool per upstream, sized by POOL_MAXSIZE."""
+    s = requests.Session()
+    s.gw_adapters = {}
+    for upstream, prefix in _upstream_prefixes().items():
+        size = POOL_MAXSIZE.get(upstream, 10)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=size)
+        s.mount(prefix, adapter)
+        s.gw_adapters[upstream] = adapter
+    _SESSIONS.add(s)
+    return s
+
+# One Session for every thread (batch, refresh, hedge and server workers) by default. requests
+# doesn't promise a Session is thread-safe in general, but this one only ever issues GETs: its
+# adapters and headers are fixed when it's built (reset_sessions() swaps in a new one rather
+# than mutating it), the connection pools are urllib3's thread-safe PoolManager, and the only
+# state a response writes back is the cookie jar, which http.cookiejar guards with its own lock.
+# Sharing keeps keep-alive connections few and warm; PER_THREAD_SESSIONS trades that for isolation.
+SESSION = _new_session()
+
+def _session() -> requests.Session:
+    """The shared SESSION (urllib3 pools are thread-safe), or this thread's own with PER_THREAD_SESSIONS."""
+    if not PER_THREAD_SESSIONS:
+        return SESSION
+    s = getattr(_TLS, "session", None)
+    if s is None:
+        s = _TLS.session = _new_session()
+        weakref.finalize(threading.current_thread(), _retire_session, s)
+    return s
+
+_RETIRED: Dict[str, List[int]] = {}
+
+def _session_counts(s: requests.Session) -> Dict[str, Tuple[int, int]]:
+    out = {}
+    for upstream, adapter in getattr(s, "gw_adapters", {}).items():
+        pools = adapter.poolmanager.pools
+        conns = reqs = 0
+        for k in pools.keys():
+            pool = pools.get(k)
+            if pool is not None:
+                conns += pool.num_connections
+                reqs += pool.num_requests
+        out[upstream] = (conns, reqs)
+    return out
+
+def _retire_session(s: requests.Session) -> None:
+    """Fold a finished thread's session into the totals and close its connections."""
+    for upstream, (conns, reqs) in _session_counts(s).items():
+        tot = _RETIRED.setdefault(upstream, [0, 0])
+        tot[0] += conns
+        tot[1] += reqs
+    s.close()
+
+def reset_sessions() -> None:
+    """Rebuild sessions after changing endpoint URLs or POOL_MAXSIZE."""
+    global SESSION
+    SESSION = _new_session()
+    _TLS.__dict__.clear()
+
+def prewarm_connections(per_upstream: int = PREWARM_CONNECTIONS) -> int:
+    """Open up to per_upstream keep-alive connections (TCP + TLS) to each upstream; returns how many
+    warm-up requests got a response. With PER_THREAD_SESSIONS only the calling thread's session warms."""
+    s = _session()
+    urls = [url for url in (GEOCODE_URL, PLACES_TEXT_URL, OWM_URL) for _ in range(per_upstream)]
+
+    def head(url: str) -> bool:
+        try:
+            s.head(url, timeout=(CONNECT_TIMEOUT_S, TIMEOUT_S))  # unauthenticated HEAD: not billed, just opens the connection
+            return True
+        except requests.exceptions.RequestException:
+            return False
+    if not urls:
+        return 0
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        return sum(pool.map(head, urls))
+
+def connection_stats() -> Dict[str, dict]:
+    """Per upstream: connections opened (each a TCP + TLS handshake) vs requests that reused one."""
+    out = {u: {"new_connections": 0, "requests": 0} for u in POOL_MAXSIZE}
+    totals = [dict(_RETIRED)] + [_session_counts(s) for s in list(_SESSIONS)]
+    for counts in totals:
+        for upstream, (conns, reqs) in counts.items():
+            if upstream in out:
+                out[upstream]["new_connections"] += conns
+                out[upstream]["requests"] += reqs
+    for v in out.values():
+        v["reused"] = max(0, v["requests"] - v["new_connections"])
+    return out
+
+LIMITERS: Dict[str, TokenBucket] = {u: TokenBucket(q) for u, q in RATE_LIMIT_QPS.items() if q}
+RETRY_STATS: Dict[str, int] = {u: 0 for u in UPSTREAM_LABELS}
+
+class Hedger:
+    """Hedging policy for one upstream: when to send a duplicate request, and whether budget allows it.
+
+    The delay is HEDGE_PERCENTILE of the upstream's own http_<upstream> latency, so it adapts
+    as the upstream speeds up or slows down. Each request earns HEDGE_MAX_RATIO of a hedge
+    (banking at most HEDGE_BURST), so a slow upstream never sees much more than its usual load.
+    """
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        self.sent = self.wins = self.denied = 0
+        self._tokens = float(HEDGE_BURST)
+        self._threshold: Optional[float] = None
+        self._stamp = float("-inf")
+        self._lock = threading.Lock()
+
+    def delay(self) -> Optional[float]:
+        """Seconds to give the first attempt before hedging, or None not to hedge."""
+        if self.upstream not in HEDGE_UPSTREAMS:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._tokens = min(HEDGE_BURST, self._tokens + HEDGE_MAX_RATIO)
+            if now - self._stamp >= HEDGE_REFRESH_S:
+                h = METRICS.histogram(f"http_{self.upstream}")
+                self._threshold = (max(HEDGE_MIN_DELAY_S, h.percentile(HEDGE_PERCENTILE))
+                                   if h.count >= HEDGE_MIN_SAMPLES else None)
+                self._stamp = now
+            return self._threshold
+
+    def allow(self) -> bool:
+        """Spend a hedge, if the budget and the upstream's rate limiter both have a token now."""
+        limiter = LIMITERS.get(self.upstream)
+        with self._lock:
+            if self._tokens < 1 or (limiter is not None and not limiter.try_take()):
+                self.denied += 1
+                return False
+            self._tokens -= 1
+            self.sent += 1
+            return True
+
+    def won(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+    def stats(self) -> dict:
+        return {"threshold_ms": round(1000 * self._threshold, 3) if self._threshold else None,
+                "sent": self.sent, "wins": self.wins, "denied": self.denied}
+
+HEDGERS: Dict[str, Hedger] = {u: Hedger(u) for u in UPSTREAM_LABELS}
+
+class CircuitOpenError(ConnectionError):
+    """An upstream's circuit breaker is open, so the call failed fast without being sent."""
+
+class CircuitBreaker:
+    """Closed -> open when the upstream's recent error rate crosses BREAKER_ERROR_RATE; open -> half-open
+    after BREAKER_OPEN_S, where one trial request decides between closed and open again."""
+    STATES = ("closed", "half_open", "open")
+
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        self.state = "closed"
+        self.opened = self.rejected = 0
+        self._outcomes: deque = deque()  # (monotonic time, ok) within BREAKER_WINDOW_S
+        self._failures = 0
+        self._since = 0.0                # when the state last changed, or the last probe went out
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may go out now; in half-open this hands out the probe slots."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if now - self._since >= BREAKER_OPEN_S:  # cooled down, or a probe never reported back
+                self.state, self._since, self._probes = "half_open", now, 0
+            if self.state == "half_open" and self._probes < BREAKER_HALF_OPEN_PROBES:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def rejecting(self) -> bool:
+        """Open and still cooling down, so callers with an alternative should use it."""
+        return self.state == "open" and time.monotonic() - self._since < BREAKER_OPEN_S
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "half_open":
+                if ok:
+                    self.state, self._since = "closed", now
+                    self._outcomes.clear()
+                    self._failures = 0
+                else:
+                    self._trip(now)
+                return
+            if self.state == "open":  # a straggler from before the trip
+                return
+            self._outcomes.append((now, ok))
+            self._failures += not ok
+            while now - self._outcomes[0][0] > BREAKER_WINDOW_S:
+                self._failures -= not self._outcomes.popleft()[1]
+            n = len(self._outcomes)
+            if n >= BREAKER_MIN_CALLS and self._failures >= BREAKER_ERROR_RATE * n:
+                self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self.state, self._since = "open", now
+        self.opened += 1
+        METRICS.incr(f"breaker_opened_{self.upstream}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._outcomes)
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected,
+                    "window_calls": n, "error_rate": round(self._failures / n, 3) if n else 0.0}
+
+BREAKERS: Dict[str, CircuitBreaker] = {u: CircuitBreaker(u) for u in UPSTREAM_LABELS}
+
+def _breaker_gate(upstream: str, label: str) -> CircuitBreaker:
+    breaker = BREAKERS[upstream]
+    if not breaker.allow():
+        raise CircuitOpenError(f"{label} is failing; circuit open, not calling it for now.")
+    return breaker
+
+
+_HEDGE_POOL: Optional[ThreadPoolExecutor] = None
+_HEDGE_POOL_LOCK = threading.Lock()
+_HEDGE_WARMING = False
+_HEDGE_SLOTS = threading.BoundedSemaphore(HEDGE_WORKERS)  # one per worker, so a hedge job never queues
+
+def _warm_hedge_pool() -> None:
+    global _HEDGE_POOL
+    pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="gw-hedge")
+    barrier = threading.Barrier(HEDGE_WORKERS)  # every job blocks until all workers exist
+    for f in [pool.submit(barrier.wait) for _ in range(HEDGE_WORKERS)]:
+        f.result()
+    _HEDGE_POOL = pool
+
+def _hedge_pool() -> Optional[ThreadPoolExecutor]:
+    """The hedge pool once all its workers are running, else None (and start them in the background).
+
+    ThreadPoolExecutor spawns workers inside submit(), and under load a thread start can stall
+    the submitting request for seconds, so that never happens on a request path.
+    """
+    global _HEDGE_WARMING
+    with _HEDGE_POOL_LOCK:
+        if _HEDGE_POOL is None and not _HEDGE_WARMING:
+            _HEDGE_WARMING = True
+            threading.Thread(target=_warm_hedge_pool, name="gw-hedge-warm", daemon=True).start()
+    return _HEDGE_POOL
+
+def _submit_hedge(*args) -> Optional[Future]:
+    """_send on a hedge worker, or None when none is free; fut.started is set once it runs."""
+    pool = _hedge_pool()
+    if pool is None or not _HEDGE_SLOTS.acquire(blocking=False):
+        return None
+    started = threading.Event()
+
+    def run():
+        started.set()
+        return _send(*args)
+    fut = pool.submit(run)
+    fut.started = started
+    fut.add_done_callback(lambda _: _HEDGE_SLOTS.release())
+    return fut
+
+def _send(upstream: str, url: str, params: dict, timeout: Tuple[float, float]) -> requests.Response:
+    with METRICS.timer(f"http_{upstream}"):
+        return _session().get(url, params=params, timeout=timeout)
+
+def _send_hedged(upstream: str, url: str, params: dict, timeout: Tuple[float, float]) -> requests.Response:
+    """One attempt, duplicated if it hasn't answered within the upstream's hedge delay.
+
+    The first response wins; the loser finishes in the background (requests can't cancel it)
+    and still feeds the latency histogram. Transport errors lose to any response. Both
+    attempts run on hedge workers (a blocked requests call can't be abandoned, so the first
+    can't stay on this thread) while one of HEDGE_WORKERS is free; otherwise the call runs
+    here unhedged, so the pool never caps throughput. The delay counts from when the first
+    attempt is actually sent.
+    """
+    hedger = HEDGERS[upstream]
+    after = hedger.delay() if BREAKERS[upstream].state == "closed" else None  # never hedge a probe
+    first = _submit_hedge(upstream, url, params, timeout) if after is not None else None
+    if first is None:
+        return _send(upstream, url, params, timeout)
+    first.started.wait()  # the delay runs from when the attempt is sent, not from when it was queued
+    if wait([first], timeout=after).done or not hedger.allow():
+        return first.result()
+    second = _submit_hedge(upstream, url, params, timeout)
+    if second is None:
+        return first.result()
+    METRICS.incr(f"http_requests_{upstream}")
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                if f is second:
+                    hedger.won()
+                return f.result()
+    return first.result()
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
     try:
-        r = SESSION.get(url, params={**params, "key": GMAPS_KEY}, timeout=TIMEOUT_S)
-    except requests.exceptions.Timeout:
-        raise TimeoutError("Google Maps request timed out.")
-    except requests.exceptions.RequestException as e:
-        raise ConnectionError(f"Network error calling Google Maps: {e}")
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """Seconds to sleep before retry number attempt + 1, or None to give up."""
+    if attempt >= MAX_RETRIES:
+        return None
+    delay = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+    ra = _parse_retry_after(retry_after)
+    if ra is not None:
+        if ra > BACKOFF_MAX_S:
+            return None
+        delay = max(delay, ra)
+    return delay
+
+# Google reports most throttling as HTTP 200 with this status in the body, not as a 429
+_GMAPS_THROTTLED = re.compile(rb'"status"\s*:\s*"OVER_QUERY_LIMIT"')
+
+def _retryable(upstream: str, r) -> bool:
+    if r.status_code == 429 or r.status_code >= 500:
+        return True
+    return upstream != "owm" and r.status_code == 200 and _GMAPS_THROTTLED.search(r.content) is not None
+
+# Only these parts of each payload are ever read; None means "this value, whole".
+GMAPS_FIELDS = {
+    "status": None, "error_message": None,
+    "results": [{"place_id": None, "name": None, "formatted_address": None, "types": None,
+                 "geometry": {"location": None}, "address_components": None}],
+    "result": {"address_components": None, "formatted_address": None},
+}
+OWM_FIELDS = {
+    "dt": None, "name": None, "sys": {"country": None}, "coord": None,
+    "main": {"temp": None, "feels_like": None, "humidity": None},
+    "wind": {"speed": None}, "weather": [{"description": None}], "clouds": {"all": None},
+    "rain": {"1h": None}, "snow": {"1h": None},
+}
+_MISSING = object()
+_JSON_TLS = threading.local()
+_LAZY_OBJECT = (simdjson.Object,) if simdjson else ()
+_LAZY_ARRAY = (simdjson.Array,) if simdjson else ()
+
+def _json_backend() -> str:
+    if JSON_BACKEND != "auto":
+        return JSON_BACKEND
+    return "orjson" if orjson else "simdjson" if simdjson else "json"
+
+def _select(node: Any, spec: Any) -> Any:
+    """The parts of a decoded document named by spec, as plain dicts/lists."""
+    if spec is None:
+        if isinstance(node, _LAZY_OBJECT):
+            return node.as_dict()
+        return node.as_list() if isinstance(node, _LAZY_ARRAY) else node
+    if isinstance(spec, list):
+        return [_select(item, spec[0]) for item in node] if isinstance(node, (list,) + _LAZY_ARRAY) else node
+    if not isinstance(node, (dict,) + _LAZY_OBJECT):
+        return node
+    out = {}
+    for k, sub in spec.items():
+        v = node.get(k, _MISSING)
+        if v is not _MISSING:
+            out[k] = _select(v, sub)
+    return out
+
+def _decode(content: bytes, fields: dict) -> dict:
+    """Parse an upstream body straight from bytes (no text decode or charset sniffing).
+
+    With simdjson only fields are materialized, so viewports, bounds, plus codes and
+    unread OWM blocks never become Python objects (lowest peak memory). orjson and the
+    stdlib build the whole document in C; walking it again to drop fields would cost
+    more than it saves, so they return it as is (orjson is the fastest overall).
+    """
+    backend = _json_backend()
+    if backend == "simdjson":
+        parser = getattr(_JSON_TLS, "parser", None) or simdjson.Parser()
+        try:
+            doc = parser.parse(content)
+        except RuntimeError:  # a view into the previous document is still alive (e.g. in a traceback)
+            parser = simdjson.Parser()
+            doc = parser.parse(content)
+        _JSON_TLS.parser = parser
+        return _select(doc, fields)
+    return orjson.loads(content) if backend == "orjson" else json.loads(content)
+
+def _http_get(upstream: str, url: str, params: dict, deadline: Optional[Deadline] = None) -> requests.Response:
+    """Rate-limited GET on the shared session with jittered retries.
+
+    Transport failures map to TimeoutError / ConnectionError once retries run out;
+    a final 429/5xx (or Google OVER_QUERY_LIMIT) response is returned for the
+    caller's status handling. With a deadline, each attempt's timeouts are capped
+    by the remaining budget and no attempt, retry or rate-limit wait starts that
+    the budget can't cover. While the upstream's circuit breaker is open,
+    attempts raise CircuitOpenError at once.
+    """
+    label = UPSTREAM_LABELS[upstream]
+    limiter = LIMITERS.get(upstream)
+    attempt = 0
+    while True:
+        breaker = _breaker_gate(upstream, label)  # before the limiter, so rejected calls spend no token
+        wait = _limiter_wait(limiter, deadline, label)
+        if wait:
+            time.sleep(wait)
+        timeout = _hop_timeouts(deadline, label)
+        err, retry_after = None, None
+        METRICS.incr(f"http_requests_{upstream}")
+        try:
+            r = _send_hedged(upstream, url, params, timeout)
+        except requests.exceptions.Timeout:
+            err = TimeoutError(f"{label} request timed out.")
+        except requests.exceptions.RequestException as e:
+            err = ConnectionError(f"Network error calling {label}: {e}")
+        breaker.record(err is None and r.status_code < 500)
+        if err is None:
+            if not _retryable(upstream, r):
+                return r
+            retry_after = r.headers.get("Retry-After")
+        delay = _retry_within(_retry_delay(attempt, retry_after), deadline)
+        if delay is None:
+            if err is not None:
+                raise err
+            return r
+        RETRY_STATS[upstream] += 1
+        time.sleep(delay)
+        attempt += 1
+
+# ---------- Google helpers ----------
+PLACES_DETAILS_FIELDS = "address_component,formatted_address"
+# Country names as Google prints them at the end of formatted_address
+GOOGLE_COUNTRY_CODES = {
+    "USA": "US", "Canada": "CA", "UK": "GB", "United Kingdom": "GB", "Australia": "AU",
+    "France": "FR", "Germany": "DE", "Spain": "ES", "Italy": "IT", "Netherlands": "NL",
+    "Belgium": "BE", "Switzerland": "CH", "Austria": "AT", "Ireland": "IE", "Portugal": "PT",
+    "Sweden": "SE", "Norway": "NO", "Denmark": "DK", "Finland": "FI", "Poland": "PL",
+    "Czechia": "CZ", "Greece": "GR", "Mexico": "MX", "Brazil": "BR", "Argentina": "AR",
+    "Japan": "JP", "South Korea": "KR", "China": "CN", "India": "IN", "Singapore": "SG",
+    "New Zealand": "NZ", "South Africa": "ZA", "Israel": "IL", "Turkey": "TR", "Türkiye": "TR",
+}
+
+def _gmaps_check(r) -> None:
+    """Raise on an HTTP error; the body is only decoded to text for the error message."""
     if r.status_code == 429:
         raise RuntimeError("Google Maps: rate limited (HTTP 429). Try again later.")
     if r.status_code >= 400:
         raise RuntimeError(f"Google Maps error {r.status_code}: {r.text[:200]}")
 
-    j = r.json()
+def _gmaps_status(j: dict) -> dict:
     status = j.get("status", "OK")
     if status not in ("OK", "ZERO_RESULTS"):
         em = j.get("error_message", "")
         raise RuntimeError(f"Google Maps API status: {status}. {em}")
     return j
 
+def _gmaps_get(url: str, params: dict, upstream: str = "geocode", deadline: Optional[Deadline] = None) -> dict:
+    """Call Google API and normalize errors/status."""
+    r = _http_get(upstream, url, {**params, "key": GMAPS_KEY}, deadline)
+    _gmaps_check(r)
+    return _gmaps_status(_decode(r.content, GMAPS_FIELDS))
+
 def _extract_city_country_from_components(components: list) -> Tuple[Optional[str], Optional[str]]:
     city = None
     country = None
@@ -67,11 +1185,7 @@ def _extract_city_country_from_components(components: list) -> Tuple[Optional[st
         city = admin2  # fallback if no locality level
     return city, country
 
-def gmaps_geocode_text(query: str) -> Optional[dict]:
-    """Use Geocoding API to resolve free text into a place with lat/lng + components."""
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    j = _gmaps_get(url, {"address": query})
-    results = j.get("results", [])
+def _pick_geocode(results: list) -> Optional[dict]:
     if not results:
         return None
 
@@ -95,11 +1209,7 @@ def gmaps_geocode_text(query: str) -> Optional[dict]:
         "types": pick.get("types", []),
     }
 
-def gmaps_places_text_search(query: str) -> Optional[dict]:
-    """Use Places Text Search -> Details to resolve free text."""
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-    j = _gmaps_get(url, {"query": query})
-    results = j.get("results", [])
+def _pick_place(results: list) -> Optional[dict]:
     if not results:
         return None
 
@@ -109,16 +1219,12 @@ def gmaps_places_text_search(query: str) -> Optional[dict]:
         return (is_locality,)
 
     results.sort(key=score)
-    first = results[0]
-    place_id = first["place_id"]
-    loc = first["geometry"]["location"]
+    return results[0]
 
-    det_url = "https://maps.googleapis.com/maps/api/place/details/json"
-    dj = _gmaps_get(det_url, {"place_id": place_id, "fields": "address_component,formatted_address,geometry"})
-    detail = dj.get("result") or {}
+def _place_from(first: dict, detail: dict) -> dict:
+    loc = first["geometry"]["location"]
     comps = detail.get("address_components", [])
     city, cc = _extract_city_country_from_components(comps)
-
     return {
         "lat": loc["lat"],
         "lon": loc["lng"],
@@ -128,78 +1234,1027 @@ def gmaps_places_text_search(query: str) -> Optional[dict]:
         "types": first.get("types", []),
     }
 
+@_geo_cached("geocode")
+def gmaps_geocode_text(query: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    """Use Geocoding API to resolve free text into a place with lat/lng + components."""
+    j = _gmaps_get(GEOCODE_URL, {"address": query}, deadline=deadline)
+    return _pick_geocode(j.get("results", []))
+
+def _place_from_search(first: dict) -> Optional[dict]:
+    """Text Search result as a place when it is a locality whose country we can read off
+    formatted_address; None means Details is needed."""
+    if "locality" not in first.get("types", []) or not first.get("name"):
+        return None
+    country = (first.get("formatted_address") or "").rsplit(",", 1)[-1].strip()
+    cc = GOOGLE_COUNTRY_CODES.get(country)
+    if not cc:
+        return None
+    comps = [{"long_name": first["name"], "short_name": first["name"], "types": ["locality"]},
+             {"long_name": country, "short_name": cc, "types": ["country"]}]
+    return _place_from(first, {"address_components": comps})
+
+def _place_details(place_id: str, deadline: Optional[Deadline] = None) -> dict:
+    """Details (address components) for place_id, cached in GEO_CACHE by place_id."""
+    key = f"details|{place_id}"
+    hit = GEO_CACHE.get(key)
+    if hit is not None:
+        return hit
+
+    def fetch():
+        with METRICS.timer("places_details"):
+            dj = _gmaps_get(PLACES_DETAILS_URL, {"place_id": place_id, "fields": PLACES_DETAILS_FIELDS},
+                            upstream="places", deadline=deadline)
+        detail = dj.get("result") or {}
+        detail = {k: detail[k] for k in ("address_components", "formatted_address") if k in detail}
+        GEO_CACHE.put(key, detail)
+        return detail
+    return GEO_FLIGHT.do(key, fetch, timeout=_budget(deadline))
+
+@_geo_cached("places")
+def gmaps_places_text_search(query: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    """Use Places Text Search (-> Details when the search result isn't enough) to resolve free text."""
+    with METRICS.timer("places_search"):
+        j = _gmaps_get(PLACES_TEXT_URL, {"query": query}, upstream="places", deadline=deadline)
+    first = _pick_place(j.get("results", []))
+    if first is None:
+        return None
+    if PLACES_DERIVE_FROM_SEARCH:
+        geo = _place_from_search(first)
+        if geo:
+            METRICS.incr("places_details_skipped")
+            return geo
+    return _place_from(first, _place_details(first["place_id"], deadline))
+
+# ---------- Alias registry ----------
+def load_alias_registry(path: Optional[str] = ALIASES_PATH) -> Dict[str, dict]:
+    """ALIASES plus any entries in the JSON registry at path (which may carry lat/lon/formatted)."""
+    reg = {normalize_query(k): {"city": city, "country": cc} for k, (city, cc) in ALIASES.items()}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for k, v in json.load(f).items():
+                reg[normalize_query(k)] = v
+    return reg
+
+def _learn_redundant_suffixes(reg: Dict[str, dict]) -> None:
+    """Teach normalize_query that e.g. ", ny" / ", usa" add nothing to "new york"."""
+    for v in reg.values():
+        city = _canon_parts(v["city"])
+        formatted = _canon_parts(v.get("formatted") or "")
+        if not city or formatted[:1] != city[:1]:
+            continue
+        # "washington" alone means the state, so ", dc" is not redundant for it
+        if city[0] in US_STATES and US_STATES[city[0]] not in formatted[1:]:
+            continue
+        _REDUNDANT_SUFFIXES.setdefault(city[0], set()).update(formatted[1:] + [v["country"].casefold()])
+
+def build_alias_registry(path: str = ALIASES_PATH) -> Dict[str, dict]:
+    """Offline step: geocode each alias once and write the registry with coordinates to path."""
+    reg = load_alias_registry(path)
+    for k, v in reg.items():
+        if v.get("lat") is None:
+            geo = gmaps_geocode_text(f"{v['city']},{v['country']}")
+            if not geo:
+                raise LookupError(f"Alias '{k}' ({v['city']},{v['country']}) failed to geocode.")
+            v.update(lat=geo["lat"], lon=geo["lon"], formatted=geo.get("formatted"))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reg, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    return reg
+
+def _osa_distance(a: str, b: str, limit: int) -> int:
+    """Optimal-string-alignment edit distance, or limit + 1 once it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+class AliasIndex:
+    """SymSpell-style alias matcher: exact, space-insensitive, then near-miss lookup.
+
+    Every alias key (and its space-free form) is indexed under all variants with up to
+    ALIAS_MAX_EDIT characters deleted, so a lookup only generates the query's own delete
+    variants and verifies the few candidates they share, independent of registry size.
+    """
+    def __init__(self, keys: Iterable[str], max_edit: int = ALIAS_MAX_EDIT):
+        self.max_edit = max_edit
+        self._exact: Dict[str, str] = {}
+        self._deletes: Dict[str, set] = {}
+        for k in keys:
+            for form in {k, k.replace(" ", "")}:
+                self._exact.setdefault(form, k)
+                for d in self._variants(form, self._allowed(len(form))):
+                    self._deletes.setdefault(d, set()).add(form)
+
+    def _allowed(self, n: int) -> int:
+        return 0 if n <= 4 else min(1 if n <= 7 else 2, self.max_edit)
+
+    @staticmethod
+    def _variants(word: str, depth: int) -> set:
+        out, frontier = {word}, {word}
+        for _ in range(depth):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+            out |= frontier
+        return out
+
+    def exact(self, text: str) -> Optional[str]:
+        """Alias key for normalized text as written or with its spaces removed."""
+        for form in (text, text.replace(" ", "")):
+            if form in self._exact:
+                return self._exact[form]
+        return None
+
+    def match(self, text: str) -> Optional[str]:
+        """Alias key for normalized text, allowing a length-scaled number of typos.
+
+        A near miss must keep the first letter ("s town" is not "h town"), and a multi-word
+        key is matched word by word, each word on its own length-scaled budget, so one word
+        can't turn into another ("music city" is not "magic city", "sun city" not "sin city").
+        """
+        hit = self.exact(text)
+        if hit is not None:
+            return hit
+        q = text.replace(" ", "")
+        allowed = self._allowed(len(q))
+        if not allowed:
+            return None
+        best, best_d = None, allowed + 1
+        for v in self._variants(q, allowed):
+            for form in self._deletes.get(v, ()):
+                if form[0] != q[0]:
+                    continue
+                limit = min(allowed, self._allowed(len(form)))
+                d = _osa_distance(q, form, limit)
+                if d <= limit and (d, form) < (best_d, best or "") and self._words_close(text, self._exact[form]):
+                    best, best_d = form, d
+        return self._exact[best] if best is not None else None
+
+    def _words_close(self, text: str, key: str) -> bool:
+        if " " not in key:
+            return True
+        words, key_words = text.split(), key.split()
+        if len(words) != len(key_words):
+            return False
+        for a, b in zip(words, key_words):
+            limit = self._allowed(max(len(a), len(b)))
+            if _osa_distance(a, b, limit) > limit:
+                return False
+        return True
+
+ALIAS_REGISTRY = load_alias_registry()
+ALIAS_INDEX = AliasIndex(ALIAS_REGISTRY)
+_learn_redundant_suffixes(ALIAS_REGISTRY)
+
+# ---------- Offline gazetteer ----------
+# Index layout: b"GZT1", uint32 count, uint32 offsets[count + 1] (native byte order), then
+# UTF-8 records "key\tcc\tlat\tlon\tpopulation\tname\tadmin1\n" sorted by key.
+_GZT_MAGIC = b"GZT1"
+
+def build_gazetteer(src: str, out: str = GAZETTEER_PATH) -> int:
+    """Build the index from a GeoNames cities dump (e.g. cities15000.txt). Returns record count."""
+    recs = set()
+    with open(src, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            name, ascii_name, lat, lon, cc, admin1, pop = cols[1], cols[2], cols[4], cols[5], cols[8], cols[10], cols[14]
+            for k in {_cache_key(name), _cache_key(ascii_name)} - {""}:
+                recs.add(f"{k}\t{cc}\t{lat}\t{lon}\t{pop or 0}\t{name}\t{admin1}\n".encode("utf-8"))
+    recs = sorted(recs)
+    offsets = array("I", [0])
+    for r in recs:
+        offsets.append(offsets[-1] + len(r))
+    with open(out, "wb") as f:
+        f.write(_GZT_MAGIC + struct.pack("=I", len(recs)))
+        offsets.tofile(f)
+        f.writelines(recs)
+    return len(recs)
+
+class Gazetteer:
+    """Memory-mapped city index with exact and prefix lookup on the normalized name."""
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != _GZT_MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        (self._n,) = struct.unpack_from("=I", self._mm, 4)
+        self._offsets = memoryview(self._mm)[8:8 + 4 * (self._n + 1)].cast("I")
+        self._base = 8 + 4 * (self._n + 1)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _key(self, i: int) -> bytes:
+        start = self._base + self._offsets[i]
+        return self._mm[start:self._mm.find(b"\t", start)]
+
+    def _record(self, i: int) -> dict:
+        raw = self._mm[self._base + self._offsets[i]:self._base + self._offsets[i + 1]]
+        _, cc, lat, lon, pop, name, admin1 = raw.decode("utf-8").rstrip("\n").split("\t")
+        return {"city": name, "country": cc, "lat": float(lat), "lon": float(lon),
+                "population": int(pop), "admin1": admin1}
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @staticmethod
+    def _rank(rec: dict):
+        cc = rec["country"]
+        return (COUNTRY_PREF.index(cc) if cc in COUNTRY_PREF else len(COUNTRY_PREF), -rec["population"])
+
+    def lookup(self, name: str, country: Optional[str] = None) -> List[dict]:
+        """All cities whose normalized name equals name, best first (COUNTRY_PREF, then population)."""
+        key = _cache_key(name).encode("utf-8")
+        out = []
+        i = self._lower_bound(key)
+        while i < self._n and self._key(i) == key:
+            rec = self._record(i)
+            if country is None or rec["country"] == country.upper():
+                out.append(rec)
+            i += 1
+        return sorted(out, key=self._rank)
+
+    def prefix(self, text: str, limit: int = 10) -> List[dict]:
+        """Cities whose normalized name starts with text, best first."""
+        key = _cache_key(text).encode("utf-8")
+        out = []
+        i = self._lower_bound(key)
+        while i < self._n and self._key(i).startswith(key):
+            out.append(self._record(i))
+            i += 1
+        return sorted(out, key=self._rank)[:limit]
+
+    def resolve(self, free_text: str) -> Optional[dict]:
+        """Geo dict for a plain city name ("paris" / "paris, fr" / "salem, or"), or None to fall back to Google.
+
+        Suffixes are read after normalization, so "paris, france" and "london, uk" hit the index
+        too. A US state suffix (code or name) is matched against US records' admin1 before any
+        country reading, and a miss goes to Google rather than to a same-coded country.
+        """
+        parts = _canon_parts(free_text)
+        if not parts:
+            return None
+        state = country = None
+        for raw in free_text.split(",")[1:]:
+            tail = " ".join(_canon_parts(raw))
+            if tail in COUNTRY_SYNONYMS:
+                country = COUNTRY_SYNONYMS[tail]
+            elif tail in US_STATES or tail in _US_STATE_CODES:
+                state = US_STATES.get(tail, tail)
+            elif len(tail) == 2 and tail.isalpha():
+                country = tail
+            elif tail:
+                return None  # a county, region or other qualifier we can't check locally
+        if state:
+            if country not in (None, "us"):
+                return None
+            hits = [h for h in self.lookup(parts[0], "US") if h["admin1"].upper() == state.upper()]
+        else:
+            hits = self.lookup(parts[0], country)
+        if not hits:
+            return None
+        rec = hits[0]
+        biggest = max(hits, key=lambda h: h["population"])
+        if biggest["population"] >= GAZETTEER_DOMINANCE * max(rec["population"], 1):
+            rec = biggest
+        admin1 = rec["admin1"] if rec["admin1"].isalpha() else ""
+        return {
+            "lat": rec["lat"],
+            "lon": rec["lon"],
+            "city": rec["city"],
+            "country": rec["country"],
+            "formatted": ", ".join(p for p in (rec["city"], admin1, rec["country"]) if p),
+            "types": ["locality", "political"],
+        }
+
+GAZETTEER: Optional[Gazetteer] = Gazetteer(GAZETTEER_PATH) if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH) else None
+
+# ---------- Direct input: coordinates and postal codes ----------
+# "34.05,-118.24" goes straight to OWM; "90012" / "M5V 3L9" / "SW1A 1AA, uk" resolve from a local
+# postal-centroid table. Neither costs a geocoding call.
+_COORD = r"([-+]?\d{1,3}(?:\.\d+)?)\s*°?\s*"
+_LATLON_RE = re.compile(rf"\(?\s*{_COORD}([NS])?\s*(,|;|\s)\s*{_COORD}([EW])?\s*\)?", re.IGNORECASE)
+
+def parse_latlon(text: str) -> Optional[Tuple[float, float]]:
+    """(lat, lon) for "34.05,-118.24", "34.05 -118.24" or "34.05N 118.24W"; None if text isn't a coordinate pair."""
+    m = _LATLON_RE.fullmatch(text.strip())
+    if not m:
+        return None
+    lat_s, ns, sep, lon_s, ew = m.groups()
+    if not (ns or ew):
+        decimals = ("." in lat_s) + ("." in lon_s)
+        if decimals < (2 if sep.isspace() else 1):
+            return None  # "10 20" or "12,150" is more likely an address fragment than a coordinate
+    lat, lon = float(lat_s), float(lon_s)
+    if (ns and lat < 0) or (ew and lon < 0):
+        return None  # sign and hemisphere both given
+    if ns and ns.upper() == "S":
+        lat = -lat
+    if ew and ew.upper() == "W":
+        lon = -lon
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+# Full code, then the shorter form the free GeoNames dumps carry (CA: FSA, GB: outward code)
+POSTAL_FORMATS = {
+    "US": r"(\d{5})(?:-\d{4})?",
+    "CA": r"([A-Z]\d[A-Z]) ?(\d[A-Z]\d)?",
+    "GB": r"([A-Z]{1,2}\d[A-Z\d]?) ?(\d[A-Z]{2})?",
+    "AU": r"(\d{4})",
+    "FR": r"(\d{5})",
+    "DE": r"(\d{5})",
+}
+_PST_MAGIC = b"PST1"
+_PST_REC = struct.Struct("=12siiI")  # "US90012", lat and lon in 1e-5 degrees, offset of "place\tadmin1" in names
+
+def build_postal_table(src: str, out: str = POSTAL_PATH, countries: Optional[Iterable[str]] = None) -> int:
+    """Build the postal table from a GeoNames postal dump (allCountries.txt or e.g. US.txt from
+    download.geonames.org/export/zip). Codes listed more than once get their mean centroid."""
+    keep = {c.upper() for c in countries} if countries else None
+    acc: Dict[bytes, list] = {}
+    with open(src, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 11 or not cols[9] or (keep and cols[0] not in keep):
+                continue
+            key = (cols[0] + cols[1].replace(" ", "").upper()).encode("ascii", "ignore")
+            if not 3 <= len(key) <= 12:
+                continue
+            a = acc.setdefault(key, [0.0, 0.0, 0, f"{cols[2]}\t{cols[4]}"])
+            a[0] += float(cols[9])
+            a[1] += float(cols[10])
+            a[2] += 1
+    names: Dict[str, int] = {}
+    blob = bytearray()
+    recs = bytearray()
+    for key in sorted(acc):
+        lat, lon, n, name = acc[key]
+        if name not in names:
+            names[name] = len(blob)
+            blob += name.encode("utf-8") + b"\n"
+        recs += _PST_REC.pack(key, round(lat / n * 1e5), round(lon / n * 1e5), names[name])
+    with open(out, "wb") as f:
+        f.write(_PST_MAGIC + struct.pack("=I", len(acc)))
+        f.write(recs)
+        f.write(blob)
+    return len(acc)
+
+class PostalTable:
+    """Memory-mapped postal-code centroids: fixed-width sorted records plus a blob of place names."""
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != _PST_MAGIC:
+            raise ValueError(f"{path} is not a postal table")
+        (self._n,) = struct.unpack_from("=I", self._mm, 4)
+        self._names = 8 + self._n * _PST_REC.size
+
+    def __len__(self) -> int:
+        return self._n
+
+    def get(self, country: str, code: str) -> Optional[dict]:
+        """Centroid for an exact (country, code); code without spaces, upper case."""
+        key = (country.upper() + code).encode("ascii", "ignore").ljust(12, b"\0")
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, lat, lon, name_at = _PST_REC.unpack_from(self._mm, 8 + mid * _PST_REC.size)
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                start = self._names + name_at
+                place, _, admin1 = self._mm[start:self._mm.find(b"\n", start)].decode("utf-8").partition("\t")
+                return {"lat": lat / 1e5, "lon": lon / 1e5, "place": place, "admin1": admin1}
+        return None
+
+    def resolve(self, free_text: str) -> Optional[dict]:
+        """Geo dict for a postal code, optionally with a country ("75001, fr"); None if not one we know."""
+        code, cc = free_text.strip(), None
+        head, sep, tail = code.rpartition(",")
+        if not sep:
+            head, sep, tail = code.rpartition(" ")
+        tail = tail.strip().lower()
+        tail_cc = COUNTRY_SYNONYMS.get(tail) or (tail if len(tail) == 2 and tail.isalpha() else None)
+        if sep and tail_cc and tail_cc.upper() in POSTAL_FORMATS:
+            code, cc = head.strip(), tail_cc.upper()
+        code = code.upper()
+        candidates = [cc] if cc else [c for c in COUNTRY_PREF if c in POSTAL_FORMATS] + \
+            [c for c in POSTAL_FORMATS if c not in COUNTRY_PREF]
+        for country in candidates:
+            m = re.fullmatch(POSTAL_FORMATS[country], code)
+            if not m:
+                continue
+            for key in dict.fromkeys(("".join(g for g in m.groups() if g), m.group(1))):
+                rec = self.get(country, key)
+                if rec:
+                    admin1 = rec["admin1"] if rec["admin1"].isalpha() else ""
+                    label = " ".join(p for p in (admin1, key) if p)
+                    return {
+                        "lat": rec["lat"],
+                        "lon": rec["lon"],
+                        "city": rec["place"],
+                        "country": country,
+                        "formatted": ", ".join(p for p in (rec["place"], label, country) if p),
+                        "types": ["postal_code"],
+                    }
+        return None
+
+POSTAL: Optional[PostalTable] = PostalTable(POSTAL_PATH) if POSTAL_PATH and os.path.exists(POSTAL_PATH) else None
+
+def resolve_direct(free_text: str) -> Optional[dict]:
+    """Geo dict for input that needs no geocoding (coordinates, known postal codes), else None."""
+    latlon = parse_latlon(free_text)
+    if latlon:
+        METRICS.incr("direct_latlon")
+        lat, lon = latlon
+        return {"lat": lat, "lon": lon, "city": None, "country": None,
+                "formatted": f"{lat}, {lon}", "types": ["coordinates"]}
+    geo = POSTAL.resolve(free_text) if POSTAL else None
+    if geo:
+        METRICS.incr("direct_postal")
+    return geo
+
 # ---------- OpenWeatherMap ----------
-def owm_current_by_latlon(lat: float, lon: float, units: str = UNITS) -> dict:
-    try:
-        r = SESSION.get(
-            "https://api.openweathermap.org/data/2.5/weather",
-            params={"lat": lat, "lon": lon, "appid": OWM_KEY, "units": units},
-            timeout=TIMEOUT_S,
-        )
-    except requests.exceptions.Timeout:
-        raise TimeoutError("OpenWeatherMap request timed out.")
-    except requests.exceptions.RequestException as e:
-        raise ConnectionError(f"Network error calling OpenWeatherMap: {e}")
+OWM_FETCH_UNITS = "metric"  # canonical: °C and m/s; _to_units converts per caller
+WX_CACHE = TTLCache(WX_CACHE_MAX, WX_STALE_IF_ERROR_S)  # values are (fetched_at, WeatherObservation)
+WX_FLIGHT = SingleFlight()
+
+def _snap(v: float, grid: float = WX_GRID_DEG) -> float:
+    return round(round(v / grid) * grid, 6) if grid else v
 
+def _owm_check(r) -> None:
     if r.status_code == 401:
         raise PermissionError("OpenWeatherMap Unauthorized — check your key / plan.")
     if r.status_code >= 400:
         raise RuntimeError(f"OpenWeatherMap error {r.status_code}: {r.text[:200]}")
-    j = r.json()
+
+def _owm_normalize(j: dict) -> WeatherObservation:
     try:
-        return {
-            "source": "current",
-            "time_utc": datetime.fromtimestamp(j["dt"], tz=timezone.utc).isoformat(),
-            "location": {
-                "name": j.get("name"),
-                "country": (j.get("sys") or {}).get("country"),
-                "coord": j.get("coord"),
-            },
-            "temp": j["main"]["temp"],
-            "feels_like": j["main"]["feels_like"],
-            "humidity": j["main"]["humidity"],
-            "wind_mps": (j.get("wind") or {}).get("speed"),
-            "weather": j["weather"][0]["description"] if j.get("weather") else None,
-            "clouds_pct": (j.get("clouds") or {}).get("all"),
-            "rain_mm_1h": (j.get("rain") or {}).get("1h"),
-            "snow_mm_1h": (j.get("snow") or {}).get("1h"),
-        }
+        coord = j.get("coord") or {}
+        return WeatherObservation(
+            dt=j["dt"],
+            name=_intern(j.get("name")),
+            country=_intern((j.get("sys") or {}).get("country")),
+            lat=coord.get("lat"),
+            lon=coord.get("lon"),
+            temp=j["main"]["temp"],
+            feels_like=j["main"]["feels_like"],
+            humidity=j["main"]["humidity"],
+            wind_mps=(j.get("wind") or {}).get("speed"),
+            weather=_intern(j["weather"][0]["description"]) if j.get("weather") else None,
+            clouds_pct=(j.get("clouds") or {}).get("all"),
+            rain_mm_1h=(j.get("rain") or {}).get("1h"),
+            snow_mm_1h=(j.get("snow") or {}).get("1h"),
+        )
     except KeyError as e:
         raise RuntimeError(f"Unexpected OpenWeatherMap payload (missing {e}). Raw: {j}")
 
+def _to_units(wx: WeatherObservation, units: str) -> dict:
+    """Result dict for a metric (°C, m/s) observation with temperatures in the requested units.
+
+    wind_mps stays in m/s for every unit system; describe_weather_owm_current converts it.
+    """
+    out = wx.to_dict()
+    if units == "imperial":
+        conv = lambda c: round(c * 9 / 5 + 32, 2)
+    elif units == "standard":
+        conv = lambda c: round(c + 273.15, 2)
+    else:
+        return out
+    for k in ("temp", "feels_like"):
+        if out.get(k) is not None:
+            out[k] = conv(out[k])
+    return out
+
+def _wx_lookup(key: tuple) -> Tuple[Optional[WeatherObservation], float]:
+    item = WX_CACHE.get(key)
+    if item is None:
+        return None, 0.0
+    fetched_at, wx = item
+    return wx, time.time() - fetched_at
+
+def _wx_result(wx: WeatherObservation, age: float, units: str) -> dict:
+    out = _to_units(wx, units)
+    out["age_s"] = round(age, 1)
+    out["stale"] = age >= WX_CACHE_TTL_S
+    return out
+
+_REFRESHING: set = set()
+_REFRESH_LOCK = threading.Lock()
+_REFRESH_POOL: Optional[ThreadPoolExecutor] = None
+_REFRESH_TASKS: set = set()  # the loop only holds weak refs to tasks; keep in-flight refreshes alive
+
+def _claim_refresh(key: tuple) -> bool:
+    with _REFRESH_LOCK:
+        if key in _REFRESHING:
+            return False
+        _REFRESHING.add(key)
+        return True
+
+def _refresh_in_background(key: tuple) -> None:
+    global _REFRESH_POOL
+    if not _claim_refresh(key):
+        return
+    with _REFRESH_LOCK:
+        if _REFRESH_POOL is None:
+            _REFRESH_POOL = ThreadPoolExecutor(max_workers=WX_REFRESH_WORKERS, thread_name_prefix="gw-refresh")
+
+    def run():
+        try:
+            WX_FLIGHT.do(key, lambda: _owm_fetch_store(key))
+            METRICS.incr("wx_background_refresh")
+        except Exception:
+            METRICS.incr("wx_background_refresh_failed")
+        finally:
+            with _REFRESH_LOCK:
+                _REFRESHING.discard(key)
+    _REFRESH_POOL.submit(run)
+
+def owm_current_by_latlon(lat: float, lon: float, units: str = UNITS, deadline: Optional[Deadline] = None) -> dict:
+    """Current weather at the grid cell containing lat/lon, served from WX_CACHE when fresh.
+
+    Always fetched in OWM_FETCH_UNITS and converted locally, so every unit system
+    shares one cache slot and one upstream call. Entries older than WX_CACHE_TTL_S
+    are served at once and refreshed in the background up to WX_SWR_S, and served
+    instead of an upstream error up to WX_STALE_IF_ERROR_S; "age_s" and "stale" in
+    the result say which happened.
+    """
+    lat, lon = _snap(lat), _snap(lon)
+    key = (lat, lon)
+    wx, age = _wx_lookup(key)
+    if wx is not None and age < WX_CACHE_TTL_S:
+        return _wx_result(wx, age, units)
+    if wx is not None and age < WX_SWR_S:
+        METRICS.incr("wx_stale_while_revalidate")
+        _refresh_in_background(key)
+        return _wx_result(wx, age, units)
+    try:
+        fresh = WX_FLIGHT.do(key, lambda: _owm_fetch_store(key, deadline), timeout=_budget(deadline))
+    except (TimeoutError, ConnectionError, RuntimeError):
+        if wx is None:
+            raise
+        METRICS.incr("wx_stale_if_error")
+        return _wx_result(wx, age, units)
+    return _wx_result(fresh, 0.0, units)
+
+def _owm_fetch_store(key: tuple, deadline: Optional[Deadline] = None) -> WeatherObservation:
+    wx = _owm_fetch(*key, deadline=deadline)
+    WX_CACHE.put(key, (time.time(), wx))
+    return wx
+
+def _owm_fetch(lat: float, lon: float, deadline: Optional[Deadline] = None) -> WeatherObservation:
+    r = _http_get("owm", OWM_URL, {"lat": lat, "lon": lon, "appid": OWM_KEY, "units": OWM_FETCH_UNITS}, deadline)
+    _owm_check(r)
+    return _owm_normalize(_decode(r.content, OWM_FIELDS))
+
 # ---------- High-level entry ----------
-def get_current_weather_via_gmaps(free_text: str, units: str = UNITS) -> dict:
-    key = free_text.strip().lower()
+def _attach_resolved(wx: dict, free_text: str, geo: dict, alias: Optional[str] = None) -> dict:
+    if alias:
+        wx["resolved"] = {"input": free_text, "alias": alias, "formatted": geo.get("formatted")}
+    else:
+        wx["resolved"] = {
+            "input": free_text,
+            "city": geo.get("city"),
+            "country": geo.get("country"),
+            "formatted": geo.get("formatted"),
+            "types": geo.get("types"),
+        }
+    return wx
+
+FALLBACK_STATS = {"primary_misses": 0, "fallback_wins": 0, "speculative": 0}
+_SPEC_POOL: Optional[ThreadPoolExecutor] = None
+
+_SPEC_POOL_LOCK = threading.Lock()
+
+def _spec_pool() -> ThreadPoolExecutor:
+    global _SPEC_POOL
+    with _SPEC_POOL_LOCK:
+        if _SPEC_POOL is None:
+            _SPEC_POOL = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="gw-fallback")
+    return _SPEC_POOL
+
+def _speculate(stage: str, free_text: str) -> bool:
+    """Whether to send the ', US' retry alongside the primary: only when the primary will
+    actually call Google (a cached or known-empty primary answers without a round trip)."""
+    key = f"{stage}|{_cache_key(free_text)}"
+    return SPECULATIVE_US_FALLBACK and key not in GEO_CACHE and key not in NEG_CACHE
+
+def _primary_resolver(places, geocode):
+    """(resolver, stage) for the configured mode; Geocoding stands in while the Places breaker is open."""
+    if not USE_PLACES:
+        return geocode, "geocode"
+    if BREAKERS["places"].rejecting():
+        METRICS.incr("places_breaker_geocode")
+        return geocode, "geocode"
+    return places, "places"
+
+def _google_resolve(free_text: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    """Primary Google lookup, then the ', US'-biased retry if it came back empty.
+
+    With SPECULATIVE_US_FALLBACK the retry is issued alongside an uncached primary that
+    hasn't answered within SPECULATIVE_DELAY_S (or as soon as it misses), so a slow primary
+    miss costs one round trip instead of two while quick answers cost no extra call. The
+    primary answer still wins whenever it is acceptable. While the Places breaker is open,
+    Geocoding is the primary.
+    """
+    primary, stage = _primary_resolver(gmaps_places_text_search, gmaps_geocode_text)
+    fallback_q = f"{free_text}, US"
+    fut = None
+    if _speculate(stage, free_text):
+        settled, missed = threading.Event(), []
+
+        def speculative():
+            if settled.wait(SPECULATIVE_DELAY_S) and not missed:
+                return None  # the primary answered (or failed) in time
+            FALLBACK_STATS["speculative"] += 1
+            return gmaps_geocode_text(fallback_q, deadline)
+        fut = _spec_pool().submit(speculative)
+        try:
+            with METRICS.timer(stage):
+                geo = primary(free_text, deadline)
+            if not geo:
+                missed.append(True)
+        finally:
+            settled.set()
+    else:
+        with METRICS.timer(stage):
+            geo = primary(free_text, deadline)
+    if geo:
+        return geo
+    FALLBACK_STATS["primary_misses"] += 1
+    with METRICS.timer("fallback"):
+        geo = fut.result() if fut is not None else gmaps_geocode_text(fallback_q, deadline)
+    if geo:
+        FALLBACK_STATS["fallback_wins"] += 1
+    return geo
+
+def _alias_entry(key: str, free_text: str) -> Optional[dict]:
+    """Registry entry for a normalized query. A near miss only counts when the gazetteer
+    has no city of that exact name, so real places ("vega") aren't taken for aliases."""
+    alias_key = ALIAS_INDEX.exact(key)
+    if alias_key is None:
+        alias_key = ALIAS_INDEX.match(key)
+        if alias_key is not None and GAZETTEER and GAZETTEER.resolve(free_text):
+            alias_key = None
+    return ALIAS_REGISTRY.get(alias_key) if alias_key else None
+
+@METRICS.timed("total")
+def get_current_weather_via_gmaps(free_text: str, units: str = UNITS,
+                                  deadline_s: Optional[float] = REQUEST_DEADLINE_S) -> dict:
+    """Weather for free text, spending at most deadline_s across every upstream hop (TimeoutError past it)."""
+    deadline = Deadline(deadline_s) if deadline_s else None
+
+    # Coordinates and postal codes need no geocoding at all
+    with METRICS.timer("direct"):
+        geo = resolve_direct(free_text)
+    if geo:
+        with METRICS.timer("weather"):
+            wx = owm_current_by_latlon(geo["lat"], geo["lon"], units=units, deadline=deadline)
+        return _attach_resolved(wx, free_text, geo)
 
-    # Alias first (fast path for 'la', 'nyc', etc.)
-    if key in ALIASES:
-        city, cc = ALIASES[key]
-        geo = gmaps_geocode_text(f"{city},{cc}")
+    key = normalize_query(free_text)
+
+    # Alias next (fast path for 'la', 'nyc', etc.); pre-resolved entries skip Google
+    with METRICS.timer("alias"):
+        alias = _alias_entry(key, free_text)
+    if alias:
+        label = f"{alias['city']},{alias['country']}"
+        geo = alias if alias.get("lat") is not None else gmaps_geocode_text(label, deadline)
         if not geo:
-            raise LookupError(f"Alias '{city},{cc}' failed to geocode.")
-        wx = owm_current_by_latlon(geo["lat"], geo["lon"], units=units)
-        wx["resolved"] = {"input": free_text, "alias": f"{city},{cc}", "formatted": geo.get("formatted")}
-        return wx
+            raise LookupError(f"Alias '{label}' failed to geocode.")
+        with METRICS.timer("weather"):
+            wx = owm_current_by_latlon(geo["lat"], geo["lon"], units=units, deadline=deadline)
+        return _attach_resolved(wx, free_text, geo, alias=label)
 
-    # Use Google to resolve text → lat/lon
-    geo = gmaps_places_text_search(free_text) if USE_PLACES else gmaps_geocode_text(free_text)
+    # Local gazetteer for plain city names, then Google to resolve text → lat/lon
+    with METRICS.timer("gazetteer"):
+        geo = GAZETTEER.resolve(free_text) if GAZETTEER else None
     if not geo:
-        # Try biasing to US if nothing came back
-        geo = gmaps_geocode_text(f"{free_text}, US")
+        neg_key = f"{'places' if USE_PLACES else 'geocode'}|{_cache_key(free_text)}"
+        if neg_key in NEG_CACHE:
+            raise LookupError(f"Couldn’t resolve location: '{free_text}'")
+        geo = _google_resolve(free_text, deadline)
         if not geo:
+            NEG_CACHE.add(neg_key)
             raise LookupError(f"Couldn’t resolve location: '{free_text}'")
 
-    wx = owm_current_by_latlon(geo["lat"], geo["lon"], units=units)
-    wx["resolved"] = {
-        "input": free_text,
-        "city": geo.get("city"),
-        "country": geo.get("country"),
-        "formatted": geo.get("formatted"),
-        "types": geo.get("types"),
+    with METRICS.timer("weather"):
+        wx = owm_current_by_latlon(geo["lat"], geo["lon"], units=units, deadline=deadline)
+    return _attach_resolved(wx, free_text, geo)
+
+# ---------- Batch ----------
+def _batch_key(q: str) -> str:
+    """Dedupe key: the point itself for coordinates and postal codes, else the normalized text."""
+    latlon = parse_latlon(q)
+    if latlon is None and POSTAL:
+        geo = POSTAL.resolve(q)
+        latlon = (geo["lat"], geo["lon"]) if geo else None
+    return f"direct|{latlon[0]},{latlon[1]}" if latlon else _cache_key(q)
+
+def get_current_weather_many(queries: Iterable[str], concurrency: int = BATCH_CONCURRENCY,
+                             units: str = UNITS, deadline_s: Optional[float] = REQUEST_DEADLINE_S) -> dict:
+    """Resolve many free-text locations on a bounded thread pool.
+
+    Identical inputs (after normalization, or the same coordinates / postal point) are
+    looked up once, each within its own deadline_s. Returns per-item results in input order; a failed item carries the
+    error instead of raising.
+    """
+    t0 = time.perf_counter()
+    queries = list(queries)
+    unique: Dict[str, str] = {}
+    for q in queries:
+        unique.setdefault(_batch_key(q), q)
+
+    def one(q: str) -> dict:
+        try:
+            return {"ok": True, "result": get_current_weather_via_gmaps(q, units=units, deadline_s=deadline_s)}
+        except Exception as e:
+            return {"ok": False, "error": str(e), "error_type": type(e).__name__}
+
+    outcomes: Dict[str, dict] = {}
+    if unique:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(unique)))) as pool:
+            for k, out in zip(unique, pool.map(one, unique.values())):
+                outcomes[k] = out
+
+    results: List[dict] = []
+    for q in queries:
+        out = dict(outcomes[_batch_key(q)])
+        if out["ok"]:
+            wx = out["result"] = dict(out["result"])
+            wx["resolved"] = {**wx["resolved"], "input": q}
+        results.append({"input": q, **out})
+    ok = sum(1 for r in results if r["ok"])
+    return {
+        "results": results,
+        "total": len(results),
+        "unique": len(unique),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "elapsed_s": round(time.perf_counter() - t0, 3),
     }
+
+# ---------- Asyncio path ----------
+# Same pipeline, outputs and error types as above, on one httpx.AsyncClient per event loop
+# so a single loop can keep many lookups in flight. Shares GEO_CACHE / WX_CACHE with the sync path.
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _async_client() -> "httpx.AsyncClient":
+    if httpx is None:
+        raise RuntimeError("The asyncio path requires httpx (pip install httpx).")
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS)
+        timeout = httpx.Timeout(TIMEOUT_S, connect=CONNECT_TIMEOUT_S)
+        client = _ASYNC_CLIENTS[loop] = httpx.AsyncClient(timeout=timeout, limits=limits)
+    return client
+
+async def aclose_async_client() -> None:
+    """Close the current event loop's client (call before the loop shuts down)."""
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def _send_async(upstream: str, url: str, params: dict, timeout: "httpx.Timeout") -> "httpx.Response":
+    with METRICS.timer(f"http_{upstream}"):
+        return await _async_client().get(url, params=params, timeout=timeout)
+
+async def _send_hedged_async(upstream: str, url: str, params: dict, timeout: "httpx.Timeout") -> "httpx.Response":
+    """_send_hedged on the event loop; here the losing request is cancelled."""
+    hedger = HEDGERS[upstream]
+    after = hedger.delay() if BREAKERS[upstream].state == "closed" else None
+    if after is None:
+        return await _send_async(upstream, url, params, timeout)
+    first = asyncio.ensure_future(_send_async(upstream, url, params, timeout))
+    done, _ = await asyncio.wait({first}, timeout=after)
+    if done or not hedger.allow():
+        return await first
+    METRICS.incr(f"http_requests_{upstream}")
+    second = asyncio.ensure_future(_send_async(upstream, url, params, timeout))
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    if t is second:
+                        hedger.won()
+                    return t.result()
+        return first.result()
+    finally:
+        for t in pending:
+            t.cancel()
+
+async def _http_get_async(upstream: str, url: str, params: dict,
+                          deadline: Optional[Deadline] = None) -> "httpx.Response":
+    label = UPSTREAM_LABELS[upstream]
+    limiter = LIMITERS.get(upstream)
+    attempt = 0
+    while True:
+        breaker = _breaker_gate(upstream, label)
+        wait = _limiter_wait(limiter, deadline, label)
+        if wait:
+            await asyncio.sleep(wait)
+        connect, read = _hop_timeouts(deadline, label)
+        err, retry_after = None, None
+        METRICS.incr(f"http_requests_{upstream}")
+        try:
+            r = await _send_hedged_async(upstream, url, params, httpx.Timeout(read, connect=connect))
+        except httpx.TimeoutException:
+            err = TimeoutError(f"{label} request timed out.")
+        except httpx.HTTPError as e:
+            err = ConnectionError(f"Network error calling {label}: {e}")
+        breaker.record(err is None and r.status_code < 500)
+        if err is None:
+            if not _retryable(upstream, r):
+                return r
+            retry_after = r.headers.get("Retry-After")
+        delay = _retry_within(_retry_delay(attempt, retry_after), deadline)
+        if delay is None:
+            if err is not None:
+                raise err
+            return r
+        RETRY_STATS[upstream] += 1
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def _gmaps_get_async(url: str, params: dict, upstream: str = "geocode",
+                           deadline: Optional[Deadline] = None) -> dict:
+    r = await _http_get_async(upstream, url, {**params, "key": GMAPS_KEY}, deadline)
+    _gmaps_check(r)
+    return _gmaps_status(_decode(r.content, GMAPS_FIELDS))
+
+@_geo_cached("geocode")
+async def gmaps_geocode_text_async(query: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    j = await _gmaps_get_async(GEOCODE_URL, {"address": query}, deadline=deadline)
+    return _pick_geocode(j.get("results", []))
+
+async def _place_details_async(place_id: str, deadline: Optional[Deadline] = None) -> dict:
+    key = f"details|{place_id}"
+    hit = GEO_CACHE.get(key)
+    if hit is not None:
+        return hit
+
+    async def fetch():
+        with METRICS.timer("places_details"):
+            dj = await _gmaps_get_async(PLACES_DETAILS_URL, {"place_id": place_id, "fields": PLACES_DETAILS_FIELDS},
+                                        upstream="places", deadline=deadline)
+        detail = dj.get("result") or {}
+        detail = {k: detail[k] for k in ("address_components", "formatted_address") if k in detail}
+        GEO_CACHE.put(key, detail)
+        return detail
+    return await GEO_FLIGHT.ado(key, fetch, timeout=_budget(deadline))
+
+@_geo_cached("places")
+async def gmaps_places_text_search_async(query: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    with METRICS.timer("places_search"):
+        j = await _gmaps_get_async(PLACES_TEXT_URL, {"query": query}, upstream="places", deadline=deadline)
+    first = _pick_place(j.get("results", []))
+    if first is None:
+        return None
+    if PLACES_DERIVE_FROM_SEARCH:
+        geo = _place_from_search(first)
+        if geo:
+            METRICS.incr("places_details_skipped")
+            return geo
+    return _place_from(first, await _place_details_async(first["place_id"], deadline))
+
+async def _owm_fetch_store_async(key: tuple, deadline: Optional[Deadline] = None) -> WeatherObservation:
+    lat, lon = key
+    r = await _http_get_async("owm", OWM_URL, {"lat": lat, "lon": lon, "appid": OWM_KEY, "units": OWM_FETCH_UNITS},
+                              deadline)
+    _owm_check(r)
+    wx = _owm_normalize(_decode(r.content, OWM_FIELDS))
+    WX_CACHE.put(key, (time.time(), wx))
     return wx
 
+async def _refresh_async(key: tuple) -> None:
+    try:
+        await WX_FLIGHT.ado(key, lambda: _owm_fetch_store_async(key))
+        METRICS.incr("wx_background_refresh")
+    except Exception:
+        METRICS.incr("wx_background_refresh_failed")
+    finally:
+        with _REFRESH_LOCK:
+            _REFRESHING.discard(key)
+
+async def owm_current_by_latlon_async(lat: float, lon: float, units: str = UNITS,
+                                      deadline: Optional[Deadline] = None) -> dict:
+    lat, lon = _snap(lat), _snap(lon)
+    key = (lat, lon)
+    wx, age = _wx_lookup(key)
+    if wx is not None and age < WX_CACHE_TTL_S:
+        return _wx_result(wx, age, units)
+    if wx is not None and age < WX_SWR_S:
+        METRICS.incr("wx_stale_while_revalidate")
+        if _claim_refresh(key):
+            task = asyncio.ensure_future(_refresh_async(key))
+            _REFRESH_TASKS.add(task)
+            task.add_done_callback(_REFRESH_TASKS.discard)
+        return _wx_result(wx, age, units)
+    try:
+        fresh = await WX_FLIGHT.ado(key, lambda: _owm_fetch_store_async(key, deadline), timeout=_budget(deadline))
+    except (TimeoutError, ConnectionError, RuntimeError):
+        if wx is None:
+            raise
+        METRICS.incr("wx_stale_if_error")
+        return _wx_result(wx, age, units)
+    return _wx_result(fresh, 0.0, units)
+
+async def _google_resolve_async(free_text: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    primary, stage = _primary_resolver(gmaps_places_text_search_async, gmaps_geocode_text_async)
+    fallback_q = f"{free_text}, US"
+    spec = None
+    if _speculate(stage, free_text):
+        first = asyncio.ensure_future(primary(free_text, deadline))
+        try:
+            with METRICS.timer(stage):
+                done, _ = await asyncio.wait({first}, timeout=SPECULATIVE_DELAY_S)
+                if not done:
+                    FALLBACK_STATS["speculative"] += 1
+                    spec = asyncio.ensure_future(gmaps_geocode_text_async(fallback_q, deadline))
+                    spec.add_done_callback(lambda t: t.cancelled() or t.exception())  # don't warn if unused
+                geo = await first
+        except BaseException:
+            first.cancel()
+            if spec is not None:
+                spec.cancel()
+            raise
+    else:
+        with METRICS.timer(stage):
+            geo = await primary(free_text, deadline)
+    if geo:
+        if spec is not None:
+            spec.cancel()
+        return geo
+    FALLBACK_STATS["primary_misses"] += 1
+    with METRICS.timer("fallback"):
+        geo = await (spec if spec is not None else gmaps_geocode_text_async(fallback_q, deadline))
+    if geo:
+        FALLBACK_STATS["fallback_wins"] += 1
+    return geo
+
+@METRICS.timed("total")
+async def get_current_weather_via_gmaps_async(free_text: str, units: str = UNITS,
+                                              deadline_s: Optional[float] = REQUEST_DEADLINE_S) -> dict:
+    deadline = Deadline(deadline_s) if deadline_s else None
+    with METRICS.timer("direct"):
+        geo = resolve_direct(free_text)
+    if geo:
+        with METRICS.timer("weather"):
+            wx = await owm_current_by_latlon_async(geo["lat"], geo["lon"], units=units, deadline=deadline)
+        return _attach_resolved(wx, free_text, geo)
+
+    key = normalize_query(free_text)
+    with METRICS.timer("alias"):
+        alias = _alias_entry(key, free_text)
+    if alias:
+        label = f"{alias['city']},{alias['country']}"
+        geo = alias if alias.get("lat") is not None else await gmaps_geocode_text_async(label, deadline)
+        if not geo:
+            raise LookupError(f"Alias '{label}' failed to geocode.")
+        with METRICS.timer("weather"):
+            wx = await owm_current_by_latlon_async(geo["lat"], geo["lon"], units=units, deadline=deadline)
+        return _attach_resolved(wx, free_text, geo, alias=label)
+
+    with METRICS.timer("gazetteer"):
+        geo = GAZETTEER.resolve(free_text) if GAZETTEER else None
+    if not geo:
+        neg_key = f"{'places' if USE_PLACES else 'geocode'}|{_cache_key(free_text)}"
+        if neg_key in NEG_CACHE:
+            raise LookupError(f"Couldn’t resolve location: '{free_text}'")
+        geo = await _google_resolve_async(free_text, deadline)
+        if not geo:
+            NEG_CACHE.add(neg_key)
+            raise LookupError(f"Couldn’t resolve location: '{free_text}'")
+
+    with METRICS.timer("weather"):
+        wx = await owm_current_by_latlon_async(geo["lat"], geo["lon"], units=units, deadline=deadline)
+    return _attach_resolved(wx, free_text, geo)
+
 # ---------- One-method natural description ----------
+@METRICS.timed("narrative")
 def describe_weather_owm_current(j: dict, units: str = UNITS) -> str:
     """Turn the OWM 'current weather' JSON (our normalized dict) into a natural sentence."""
     loc = j.get("location", {})
@@ -208,7 +2263,7 @@ def describe_weather_owm_current(j: dict, units: str = UNITS) -> str:
     weather = (j.get("weather") or "unknown conditions")
 
     # Units/values
-    temp_unit = "°F" if units == "imperial" else "°C"
+    temp_unit = {"imperial": "°F", "standard": " K"}.get(units, "°C")
     wind_unit = "mph" if units == "imperial" else "m/s"
 
     temp = j.get("temp")
@@ -249,8 +2304,166 @@ def describe_weather_owm_current(j: dict, units: str = UNITS) -> str:
         s += f", with {round(snow,1)} mm of snow in the last hour"
     return s + "."
 
+# ---------- Stats / Prometheus ----------
+def stats() -> dict:
+    """Per-stage latency summaries, counters and cache/limiter state."""
+    return {
+        "stages": {name: h.summary() for name, h in sorted(METRICS.histograms.items())},
+        "counters": dict(sorted(METRICS.counters.items())),
+        "geocode_cache": GEO_CACHE.stats(),
+        "negative_cache": NEG_CACHE.stats(),
+        "weather_cache": {"hits": WX_CACHE.hits, "misses": WX_CACHE.misses, "entries": len(WX_CACHE)},
+        "single_flight": {"geocode": GEO_FLIGHT.stats(), "weather": WX_FLIGHT.stats()},
+        "fallback": dict(FALLBACK_STATS),
+        "retries": dict(RETRY_STATS),
+        "hedging": {u: h.stats() for u, h in HEDGERS.items()},
+        "breakers": {u: b.stats() for u, b in BREAKERS.items()},
+        "connections": connection_stats(),
+    }
+
+def prometheus_text() -> str:
+    """stats() in the Prometheus text exposition format (histograms exported as summaries)."""
+    out = ["# TYPE getweather_stage_seconds summary"]
+    for name, h in sorted(METRICS.histograms.items()):
+        for q in (0.5, 0.9, 0.99):
+            out.append(f'getweather_stage_seconds{{stage="{name}",quantile="{q}"}} {h.percentile(q * 100):.6f}')
+        out.append(f'getweather_stage_seconds_sum{{stage="{name}"}} {h.total:.6f}')
+        out.append(f'getweather_stage_seconds_count{{stage="{name}"}} {h.count}')
+    out.append("# TYPE getweather_events_total counter")
+    for name, n in sorted(METRICS.counters.items()):
+        out.append(f'getweather_events_total{{event="{name}"}} {n}')
+    for name, n in sorted(FALLBACK_STATS.items()):
+        out.append(f'getweather_events_total{{event="fallback_{name}"}} {n}')
+    for name, n in sorted(RETRY_STATS.items()):
+        out.append(f'getweather_events_total{{event="retries_{name}"}} {n}')
+    for upstream, h in sorted(HEDGERS.items()):
+        for name in ("sent", "wins", "denied"):
+            out.append(f'getweather_events_total{{event="hedge_{name}_{upstream}"}} {getattr(h, name)}')
+    out.append(f'getweather_events_total{{event="negative_cache_hits"}} {NEG_CACHE.hits}')
+    for upstream, b in sorted(BREAKERS.items()):
+        out.append(f'getweather_events_total{{event="breaker_rejected_{upstream}"}} {b.rejected}')
+    out.append("# TYPE getweather_breaker_state gauge")
+    for upstream, b in sorted(BREAKERS.items()):
+        out.append(f'getweather_breaker_state{{upstream="{upstream}"}} {CircuitBreaker.STATES.index(b.state)}')
+    out.append("# TYPE getweather_connections_total counter")
+    for upstream, c in sorted(connection_stats().items()):
+        out.append(f'getweather_connections_total{{upstream="{upstream}",kind="new"}} {c["new_connections"]}')
+        out.append(f'getweather_connections_total{{upstream="{upstream}",kind="reused"}} {c["reused"]}')
+    out.append("# TYPE getweather_cache_lookups_total counter")
+    for cache, hits, misses in (("geocode", GEO_CACHE.hits, GEO_CACHE.misses),
+                                ("weather", WX_CACHE.hits, WX_CACHE.misses)):
+        out.append(f'getweather_cache_lookups_total{{cache="{cache}",result="hit"}} {hits}')
+        out.append(f'getweather_cache_lookups_total{{cache="{cache}",result="miss"}} {misses}')
+    return "\n".join(out) + "\n"
+
+def _reply(h: BaseHTTPRequestHandler, code: int, body: str, ctype: str) -> None:
+    raw = body.encode("utf-8")
+    h.send_response(code)
+    h.send_header("Content-Type", ctype)
+    h.send_header("Content-Length", str(len(raw)))
+    h.end_headers()
+    h.wfile.write(raw)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        _reply(self, 200, prometheus_text(), "text/plain; version=0.0.4; charset=utf-8")
+
+    def log_message(self, *args):
+        pass
+
+def serve_metrics(port: int = METRICS_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Expose prometheus_text() at http://host:port/metrics from a daemon thread."""
+    srv = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=srv.serve_forever, name="gw-metrics", daemon=True).start()
+    return srv
+
+# ---------- Service mode ----------
+# One long-lived process keeps SESSION's connections, the caches and the limiters warm.
+_ERROR_STATUS = [(LookupError, 404), (TimeoutError, 504), (PermissionError, 502),
+                 (CircuitOpenError, 503), (ConnectionError, 502), (RuntimeError, 502)]
+
+class _WeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        if u.path == "/weather":
+            self._weather(parse_qs(u.query))
+        elif u.path == "/stats":
+            _reply(self, 200, json.dumps(stats()), "application/json")
+        elif u.path == "/metrics":
+            _reply(self, 200, prometheus_text(), "text/plain; version=0.0.4; charset=utf-8")
+        elif u.path == "/healthz":
+            _reply(self, 200, "ok\n", "text/plain")
+        else:
+            _reply(self, 404, json.dumps({"error": "not found"}), "application/json")
+
+    def _weather(self, qs: Dict[str, List[str]]) -> None:
+        q = (qs.get("q") or [""])[0].strip()
+        units = (qs.get("units") or [UNITS])[0]
+        fmt = (qs.get("format") or ["json"])[0]
+        raw_deadline = (qs.get("deadline") or [None])[0]
+        try:
+            deadline_s = REQUEST_DEADLINE_S if raw_deadline is None else float(raw_deadline)
+        except ValueError:
+            deadline_s = math.nan
+        # An explicit deadline must be a finite number of seconds above 0 (nan, inf and 0 are rejected)
+        deadline_ok = deadline_s is None or (math.isfinite(deadline_s) and deadline_s > 0)
+        if not q or units not in ("imperial", "metric", "standard") or fmt not in ("json", "text") or not deadline_ok:
+            _reply(self, 400, json.dumps({"error": "need q, units=imperial|metric|standard, format=json|text, "
+                                                   "deadline=seconds (finite, > 0)"}), "application/json")
+            return
+        try:
+            res = get_current_weather_via_gmaps(q, units=units, deadline_s=deadline_s)
+        except Exception as e:
+            code = next((c for t, c in _ERROR_STATUS if isinstance(e, t)), 500)
+            _reply(self, code, json.dumps({"error": str(e), "error_type": type(e).__name__}), "application/json")
+            return
+        if fmt == "text":
+            _reply(self, 200, describe_weather_owm_current(res, units=units) + "\n", "text/plain; charset=utf-8")
+        else:
+            _reply(self, 200, json.dumps(res), "application/json")
+
+    def log_message(self, *args):
+        pass
+
+def serve(host: str = SERVE_HOST, port: int = SERVE_PORT) -> None:
+    """Serve /weather, /stats, /metrics and /healthz until interrupted."""
+    srv = ThreadingHTTPServer((host, port), _WeatherHandler)
+    srv.daemon_threads = True
+    threading.Thread(target=prewarm_connections, name="gw-prewarm", daemon=True).start()
+    print(f"Serving on http://{host}:{srv.server_address[1]}/weather?q=...")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
 # ---- Example CLI ----
 if __name__ == "__main__":
+    if sys.argv[1:] == ["--build-aliases"]:
+        reg = build_alias_registry()
+        print(f"Wrote {len(reg)} aliases to {ALIASES_PATH}")
+        sys.exit(0)
+    if sys.argv[1:2] == ["--serve"]:
+        serve(port=int(sys.argv[2]) if len(sys.argv) > 2 else SERVE_PORT)
+        sys.exit(0)
+    if len(sys.argv) == 3 and sys.argv[1] == "--normalize-report":
+        with open(sys.argv[2], encoding="utf-8") as f:
+            print(json.dumps(normalization_report(f), indent=2, ensure_ascii=False))
+        sys.exit(0)
+    if len(sys.argv) == 3 and sys.argv[1] == "--build-gazetteer":
+        n = build_gazetteer(sys.argv[2])
+        print(f"Wrote {n} gazetteer records to {GAZETTEER_PATH}")
+        sys.exit(0)
+    if len(sys.argv) in (3, 4) and sys.argv[1] == "--build-postal":
+        n = build_postal_table(sys.argv[2], countries=sys.argv[3].split(",") if len(sys.argv) == 4 else None)
+        print(f"Wrote {n} postal codes to {POSTAL_PATH}")
+        sys.exit(0)
     q = input("Where? (e.g., 'la', 'sf bay area', 'my dorm near UCLA'): ").strip()
     try:
         res = get_current_weather_via_gmaps(q, units=UNITS)
@@ -0,0 +1,76 @@
+"""Regression tests for the offline parts of getWeather (no network, no keys needed).
+
+    python -m unittest test_getweather      (or: python -m pytest test_getweather.py)
+"""
+import sys, types, unittest
+
+if "keys" not in sys.modules:
+    try:
+        import keys  # noqa: F401
+    except ImportError:  # nothing here calls an upstream
+        sys.modules["keys"] = types.SimpleNamespace(WEATHERKEY="test", MAPSKEY="test")
+import getWeather as gw
+
+
+class NormalizeQueryTest(unittest.TestCase):
+    def test_coordinates_keep_signs_and_decimals(self):
+        keys = {gw.normalize_query(q) for q in ("34.05,-118.24", "34.05,118.24", "-34.05,-118.24")}
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(gw.normalize_query("34.05, -118.24"), gw.normalize_query("34.05,-118.24"))
+
+    def test_punctuation_and_accents_fold(self):
+        self.assertEqual(gw.normalize_query("L.A."), "la")
+        self.assertEqual(gw.normalize_query("D.C."), "dc")
+        self.assertEqual(gw.normalize_query("St. Louis"), "st louis")
+        self.assertEqual(gw.normalize_query("St John's"), "st johns")
+        self.assertEqual(gw.normalize_query("Wilkes-Barre"), "wilkes barre")
+        self.assertEqual(gw.normalize_query("Zürich"), "zurich")
+
+    def test_suffixes_canonicalize(self):
+        self.assertEqual(gw.normalize_query("New York, NY"), "new york")
+        self.assertEqual(gw.normalize_query("Paris, France"), "paris, fr")
+
+    def test_exonyms_only_for_their_own_country(self):
+        self.assertEqual(gw.normalize_query("Napoli"), "naples")
+        self.assertEqual(gw.normalize_query("Roma, Italy"), "rome, it")
+        self.assertEqual(gw.normalize_query("Nueva York, NY"), "new york")
+        self.assertNotEqual(gw.normalize_query("Napoli, NY"), gw.normalize_query("Naples, NY"))
+        self.assertEqual(gw.normalize_query("Roma, TX"), "roma, tx")
+
+
+class AliasMatchTest(unittest.TestCase):
+    def match(self, text):
+        return gw.ALIAS_INDEX.match(gw.normalize_query(text))
+
+    def test_exact_and_space_free(self):
+        self.assertEqual(self.match("NYC"), "nyc")
+        self.assertEqual(self.match("chitown"), "chi town")
+
+    def test_typos(self):
+        self.assertEqual(self.match("phily"), "philly")
+        self.assertEqual(self.match("windy ciity"), "windy city")
+        self.assertEqual(self.match("big appel"), "big apple")
+
+    def test_real_names_are_not_taken_for_aliases(self):
+        for text in ("yola", "nora", "lola", "vega", "s town", "music city", "sun city", "musiccity"):
+            with self.subTest(text=text):
+                self.assertIsNone(self.match(text))
+
+
+class ParseLatLonTest(unittest.TestCase):
+    def test_pairs(self):
+        self.assertEqual(gw.parse_latlon("34.05,-118.24"), (34.05, -118.24))
+        self.assertEqual(gw.parse_latlon("34.05 -118.24"), (34.05, -118.24))
+        self.assertEqual(gw.parse_latlon("34.05N 118.24W"), (34.05, -118.24))
+        self.assertEqual(gw.parse_latlon("(51.5, -0.12)"), (51.5, -0.12))
+        self.assertEqual(gw.parse_latlon("40.7,-74"), (40.7, -74.0))
+        self.assertEqual(gw.parse_latlon("34 N, 118 W"), (34.0, -118.0))
+
+    def test_rejects(self):
+        for text in ("paris", "90012", "10 20", "1, 2", "12,150", "1;2", "91.0,0", "34.05, 181.0"):
+            with self.subTest(text=text):
+                self.assertIsNone(gw.parse_latlon(text))
+
+
+if __name__ == "__main__":
+    unittest.main()